@@ -0,0 +1,97 @@
+"""
+Compare the old "expand 180 days, sort, keep 10" upcoming-events path with
+the lazy heap merge in calendar_common.upcoming_occurrences, on a synthetic
+calendar dominated by daily and hourly recurring series.
+
+Run from the project root:
+    python benchmarks/bench_upcoming.py --series 500 --count 10
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from widgets.calendar_common import EventRecord, upcoming_occurrences, to_naive_utc
+
+
+def synthetic_records(series, seed=1):
+    """Recurring series that started up to two years ago, mostly daily or hourly."""
+    rng = random.Random(seed)
+    now = to_naive_utc(datetime.now(timezone.utc))
+    rules = ['FREQ=HOURLY', 'FREQ=DAILY', 'FREQ=DAILY', 'FREQ=WEEKLY;BYDAY=MO,WE,FR']
+    records = []
+    for i in range(series):
+        start = (now - timedelta(days=rng.randint(0, 730), hours=rng.randint(0, 23))).replace(microsecond=0)
+        records.append(EventRecord(
+            f'/cal/series-{i}.ics', None, f'series-{i}', f'Series {i}', 'Somewhere',
+            start, timedelta(minutes=30), rrule=rng.choice(rules),
+        ))
+    return records
+
+
+def expand_and_sort(records, now, count):
+    # The pre-merge algorithm: one dict per occurrence over 180 days.
+    window_end = now + timedelta(days=180)
+    upcoming = []
+    for record in records:
+        for occ in record.occurrences_between(now, window_end):
+            upcoming.append({
+                'dtstart': occ,
+                'dtend': occ + record.duration,
+                'summary': record.summary,
+                'location': record.location,
+            })
+    upcoming.sort(key=lambda ev: ev['dtstart'])
+    return upcoming[:count]
+
+
+def best_of(repeat, func, *args):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def run(series, count, repeat):
+    records = synthetic_records(series)
+    # Compile every ruleset up front, as the repository does when building records.
+    for record in records:
+        record.ruleset()
+    now = to_naive_utc(datetime.now(timezone.utc))
+
+    old = [ev['dtstart'] for ev in expand_and_sort(records, now, count)]
+    new = [occ.start for occ in upcoming_occurrences(records, now, count)]
+    if old != new:
+        raise SystemExit("Lazy merge disagrees with the expand-and-sort result")
+
+    return {
+        'series': series,
+        'count': count,
+        'expand_and_sort_s': best_of(repeat, expand_and_sort, records, now, count),
+        'lazy_merge_s': best_of(repeat, upcoming_occurrences, records, now, count),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--series', type=int, default=500)
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    result = run(args.series, args.count, args.repeat)
+    speedup = result['expand_and_sort_s'] / max(result['lazy_merge_s'], 1e-9)
+    print(f"{result['series']} series, next {result['count']} occurrences")
+    print(f"  expand 180 days + sort: {result['expand_and_sort_s'] * 1000:9.1f} ms")
+    print(f"  lazy heap merge:        {result['lazy_merge_s'] * 1000:9.1f} ms")
+    print(f"  speedup:                {speedup:9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
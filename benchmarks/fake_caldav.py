@@ -0,0 +1,320 @@
+"""
+A local stand-in CalDAV server for the benchmarks: serves one or more
+in-memory calendars over plain HTTP with just enough of WebDAV/CalDAV for
+the caldav library and widgets/caldav_sync.py (principal and home-set
+discovery, depth-1 PROPFIND, getctag/sync-token, calendar-query,
+calendar-multiget, sync-collection and GET). Time-range filters are not
+evaluated; every calendar-query returns the whole calendar.
+sync-collection reports only what changed since the client's token,
+with 404 responses for deleted members, like a real server.
+
+    python benchmarks/fake_caldav.py --events 1000 --port 8008
+"""
+import argparse
+import hashlib
+import threading
+import xml.etree.ElementTree as ET
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from xml.sax.saxutils import escape
+
+DAV = 'DAV:'
+CALDAV = 'urn:ietf:params:xml:ns:caldav'
+CS = 'http://calendarserver.org/ns/'
+APPLE = 'http://apple.com/ns/ical/'
+
+PRINCIPAL = '/principal/'
+HOME = '/calendars/'
+
+NAMESPACES = f'xmlns:D="{DAV}" xmlns:C="{CALDAV}" xmlns:CS="{CS}" xmlns:A="{APPLE}"'
+
+
+class FakeCalendar:
+    """
+    One calendar collection: {filename: ics text} plus its change counter.
+    The counter is both the ctag and the sync-token; every put or delete
+    bumps it and records which member changed at which version.
+    """
+
+    def __init__(self, name, objects, color='#3478F6FF'):
+        self.name = name
+        self.color = color
+        self.objects = dict(objects)
+        self.version = 1
+        self.changes = {}  # filename -> version of its last put or delete
+
+    @property
+    def path(self):
+        return f'{HOME}{self.name}/'
+
+    def etag(self, filename):
+        return '"' + hashlib.md5(self.objects[filename].encode()).hexdigest() + '"'
+
+    def put(self, filename, text):
+        self.objects[filename] = text
+        self.version += 1
+        self.changes[filename] = self.version
+
+    def delete(self, filename):
+        if self.objects.pop(filename, None) is not None:
+            self.version += 1
+            self.changes[filename] = self.version
+
+    def changed_since(self, version):
+        """Filenames put or deleted after version, e.g. the one in a sync-token."""
+        return [filename for filename, changed in self.changes.items() if changed > version]
+
+
+class FakeCalDAVServer:
+    """
+    Serves calendars on 127.0.0.1 from a background thread. Counts the
+    requests it answers by method so benchmarks can report round trips.
+    """
+
+    def __init__(self, calendars, port=0):
+        self.calendars = {calendar.name: calendar for calendar in calendars}
+        self.requests = {}
+        self._lock = threading.Lock()
+        handler = type('Handler', (_Handler,), {'server_state': self})
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}/'
+
+    def count(self, method):
+        with self._lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _requested_props(body):
+    # Clark-notation names of the properties a PROPFIND/REPORT asks for.
+    if not body:
+        return None
+    try:
+        root = ET.fromstring(body)
+    except ET.ParseError:
+        return None
+    prop = root.find(f'{{{DAV}}}prop')
+    if prop is None:
+        return None
+    return [child.tag for child in prop]
+
+
+def _propstat(props):
+    found = ''.join(props)
+    return (f'<D:propstat><D:prop>{found}</D:prop>'
+            f'<D:status>HTTP/1.1 200 OK</D:status></D:propstat>')
+
+
+def _response(href, props):
+    return f'<D:response><D:href>{escape(href)}</D:href>{_propstat(props)}</D:response>'
+
+
+def _not_found(href):
+    # How sync-collection reports a deleted member.
+    return (f'<D:response><D:href>{escape(href)}</D:href>'
+            f'<D:status>HTTP/1.1 404 Not Found</D:status></D:response>')
+
+
+def _token_version(token):
+    # 'token-N' -> N; None for the empty token of an initial sync.
+    if not token:
+        return None
+    prefix, _, version = token.partition('-')
+    if prefix != 'token' or not version.isdigit():
+        raise ValueError(token)
+    return int(version)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_state = None
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, every
+    # keep-alive request would stall ~40 ms on the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, body, content_type='application/xml; charset=utf-8'):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('DAV', '1, 2, 3, calendar-access')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _multistatus(self, responses, extra=''):
+        self._send(207, f'<?xml version="1.0" encoding="utf-8"?>'
+                        f'<D:multistatus {NAMESPACES}>{"".join(responses)}{extra}</D:multistatus>')
+
+    def _calendar(self):
+        # (calendar, filename or None) addressed by the request path.
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        if len(parts) < 2 or '/' + parts[0] + '/' != HOME:
+            return None, None
+        calendar = self.server_state.calendars.get(parts[1])
+        return calendar, parts[2] if len(parts) > 2 else None
+
+    def do_OPTIONS(self):
+        self.server_state.count('OPTIONS')
+        self._send(200, '')
+
+    def do_GET(self):
+        self.server_state.count('GET')
+        calendar, filename = self._calendar()
+        if calendar is None or filename not in calendar.objects:
+            self._send(404, '')
+            return
+        self._send(200, calendar.objects[filename], 'text/calendar; charset=utf-8')
+
+    def do_PROPFIND(self):
+        self.server_state.count('PROPFIND')
+        wanted = _requested_props(self._body()) or []
+        depth = self.headers.get('Depth', '0')
+        path = self.path.split('?')[0]
+        state = self.server_state
+
+        if path in ('/', PRINCIPAL):
+            props = []
+            if f'{{{DAV}}}current-user-principal' in wanted:
+                props.append(f'<D:current-user-principal><D:href>{PRINCIPAL}</D:href></D:current-user-principal>')
+            if f'{{{CALDAV}}}calendar-home-set' in wanted:
+                props.append(f'<C:calendar-home-set><D:href>{HOME}</D:href></C:calendar-home-set>')
+            if f'{{{DAV}}}resourcetype' in wanted:
+                props.append('<D:resourcetype><D:collection/></D:resourcetype>')
+            self._multistatus([_response(path, props)])
+            return
+
+        if path == HOME:
+            responses = [_response(HOME, ['<D:resourcetype><D:collection/></D:resourcetype>'])]
+            if depth != '0':
+                responses += [_response(calendar.path, self._calendar_props(calendar, wanted))
+                              for calendar in state.calendars.values()]
+            self._multistatus(responses)
+            return
+
+        calendar, filename = self._calendar()
+        if calendar is None:
+            self._send(404, '')
+            return
+        if filename:
+            if filename not in calendar.objects:
+                self._send(404, '')
+                return
+            self._multistatus([_response(self.path, [f'<D:getetag>{calendar.etag(filename)}</D:getetag>'])])
+            return
+        responses = [_response(calendar.path, self._calendar_props(calendar, wanted))]
+        if depth != '0':
+            responses += [
+                _response(calendar.path + name, [f'<D:getetag>{calendar.etag(name)}</D:getetag>',
+                                                 '<D:resourcetype/>'])
+                for name in calendar.objects
+            ]
+        self._multistatus(responses)
+
+    def _calendar_props(self, calendar, wanted):
+        props = ['<D:resourcetype><D:collection/><C:calendar/></D:resourcetype>']
+        if not wanted or f'{{{DAV}}}displayname' in wanted:
+            props.append(f'<D:displayname>{escape(calendar.name)}</D:displayname>')
+        if f'{{{APPLE}}}calendar-color' in wanted:
+            props.append(f'<A:calendar-color>{calendar.color}</A:calendar-color>')
+        if f'{{{CS}}}getctag' in wanted:
+            props.append(f'<CS:getctag>ctag-{calendar.version}</CS:getctag>')
+        if f'{{{DAV}}}sync-token' in wanted:
+            props.append(f'<D:sync-token>token-{calendar.version}</D:sync-token>')
+        if f'{{{CALDAV}}}supported-calendar-component-set' in wanted:
+            props.append('<C:supported-calendar-component-set><C:comp name="VEVENT"/>'
+                         '</C:supported-calendar-component-set>')
+        return props
+
+    def do_REPORT(self):
+        self.server_state.count('REPORT')
+        body = self._body()
+        calendar, _filename = self._calendar()
+        if calendar is None:
+            self._send(404, '')
+            return
+        try:
+            root = ET.fromstring(body)
+        except ET.ParseError:
+            self._send(400, '')
+            return
+
+        if root.tag == f'{{{CALDAV}}}calendar-multiget':
+            names = [href.text.rsplit('/', 1)[-1] for href in root.iter(f'{{{DAV}}}href') if href.text]
+            self._multistatus([self._object_response(calendar, name, True)
+                               for name in names if name in calendar.objects])
+        elif root.tag == f'{{{CALDAV}}}calendar-query':
+            with_data = root.find(f'.//{{{CALDAV}}}calendar-data') is not None
+            self._multistatus([self._object_response(calendar, name, with_data)
+                               for name in calendar.objects])
+        elif root.tag == f'{{{DAV}}}sync-collection':
+            try:
+                since = _token_version((root.findtext(f'{{{DAV}}}sync-token') or '').strip())
+            except ValueError:
+                since = -1
+            if since is not None and not 0 <= since <= calendar.version:
+                # RFC 6578 3.2: the client has to start over with a full sync.
+                self._send(403, f'<?xml version="1.0" encoding="utf-8"?>'
+                                f'<D:error {NAMESPACES}><D:valid-sync-token/></D:error>')
+                return
+            if since is None:
+                responses = [self._object_response(calendar, name, False) for name in calendar.objects]
+            else:
+                responses = [self._object_response(calendar, name, False) if name in calendar.objects
+                             else _not_found(calendar.path + name)
+                             for name in calendar.changed_since(since)]
+            self._multistatus(responses, f'<D:sync-token>token-{calendar.version}</D:sync-token>')
+        else:
+            self._send(501, '')
+
+    def _object_response(self, calendar, name, with_data):
+        props = [f'<D:getetag>{calendar.etag(name)}</D:getetag>']
+        if with_data:
+            props.append(f'<C:calendar-data>{escape(calendar.objects[name])}</C:calendar-data>')
+        return _response(calendar.path + name, props)
+
+
+def main():
+    import time
+    from synthetic_ics import synthetic_corpus
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=8008)
+    args = parser.parse_args()
+
+    server = FakeCalDAVServer([FakeCalendar('Bench', synthetic_corpus(args.events))], args.port).start()
+    print(f"Serving {args.events} events at {server.url} (calendar 'Bench'). Ctrl-C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+End-to-end benchmark suite: synthetic calendars served by a local fake
+CalDAV server, timed from discovery through parsing to widget rendering
+under Kivy's headless window, with results saved as JSON.
+
+Run from the project root:
+    python benchmarks/run_benchmarks.py --sizes 100,1000,10000
+    python benchmarks/run_benchmarks.py --sizes 1000 --compare benchmarks/results/<older>.json
+
+Steps whose dependencies are missing (caldav, kivy) are recorded as
+skipped rather than failing the run.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from fake_caldav import FakeCalDAVServer, FakeCalendar
+from synthetic_ics import synthetic_corpus, synthetic_event
+
+CALENDAR_NAME = 'Bench'
+
+
+def use_headless_window():
+    # Must run before kivy is first imported.
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+    os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+    os.environ.setdefault('KIVY_NO_FILELOG', '1')
+    os.environ.setdefault('KIVY_GL_BACKEND', 'mock')
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+
+def best_of(repeat, func, *args):
+    """Fastest of repeat runs in seconds, and the last return value."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+class Suite:
+    """Runs the steps for one corpus size and collects {step: seconds}."""
+
+    def __init__(self, size, repeat, ui):
+        self.size = size
+        self.repeat = repeat
+        self.ui = ui
+        self.results = {}
+
+    def step(self, name, func, *args, repeat=None):
+        try:
+            seconds, result = best_of(repeat or self.repeat, func, *args)
+        except ImportError as e:
+            self.results[name] = {'skipped': f'missing dependency: {e.name}'}
+            print(f"  {name:<34} skipped ({e.name} not installed)")
+            return None
+        self.results[name] = seconds
+        print(f"  {name:<34} {seconds * 1000:10.1f} ms")
+        return result
+
+    def run(self):
+        print(f"{self.size} events")
+        corpus = self.step('generate_corpus', synthetic_corpus, self.size, repeat=1)
+        try:
+            from widgets.calendar_common import connect_to_calendar, get_parsed_event, build_event_records
+        except ImportError as e:
+            self.results['parsing'] = {'skipped': f'missing dependency: {e.name}'}
+            print(f"  parsing and widget steps skipped ({e.name} not installed)")
+            return self.results
+
+        fake_calendar = FakeCalendar(CALENDAR_NAME, corpus)
+        with FakeCalDAVServer([fake_calendar]) as server:
+            connected = self.step('connect_to_calendar', connect_to_calendar,
+                                  server.url, 'bench', 'bench', CALENDAR_NAME)
+            objects = None
+            if connected and connected[1] is not None:
+                sync = self.step('initial_sync', self.initial_sync, connected[1], repeat=1)
+                objects = list(sync.objects.values())
+                self.step('unchanged_sync', sync.sync)
+                # 1% of the events edited, deleted and added on the server.
+                edit_calendar(fake_calendar, self.size)
+                diff = self.step('incremental_sync', sync.sync, repeat=1)
+                self.results['incremental_diff'] = {
+                    'added': len(diff.added), 'changed': len(diff.changed), 'removed': len(diff.removed),
+                }
+            self.results['requests'] = dict(server.requests)
+
+        if objects is None:
+            # Parse straight from the corpus when the network path was skipped.
+            from widgets.caldav_sync import RemoteObject
+            objects = [RemoteObject(f'/calendars/{CALENDAR_NAME}/{name}', None, text)
+                       for name, text in corpus.items()]
+
+        self.step('get_parsed_event', lambda: [get_parsed_event(obj) for obj in objects])
+        records = self.step('build_event_records', lambda: [
+            record for obj in objects for record in build_event_records(obj, obj.href, obj.etag)
+        ])
+        if records is not None and self.ui:
+            self.run_ui(records)
+        return self.results
+
+    def initial_sync(self, calendar):
+        from widgets.caldav_sync import CalendarSync
+
+        sync = CalendarSync(calendar)
+        sync.sync()
+        return sync
+
+    def run_ui(self, records):
+        try:
+            from widgets import event_repository
+            from widgets.calendar_widget import CalendarWidget
+            from widgets.upcoming_events_widget import UpcomingEventsWidget
+        except ImportError as e:
+            for name in ('index_update', 'calendar_widget_init', 'compute_occurrences_for_month',
+                         'render_month', 'upcoming_widget_init', 'render_events'):
+                self.results[name] = {'skipped': f'missing dependency: {e.name}'}
+            print(f"  widget steps skipped ({e.name} not installed)")
+            return
+
+        # A repository that already holds the records, so widgets never
+        # start a fetch of their own.
+        url = f'bench://{self.size}'
+        repository = event_repository.EventRepository([event_repository.CalendarSource(url)])
+        self.step('index_update', self.load_repository, repository, records, repeat=1)
+        event_repository._repositories[url] = repository
+
+        now = datetime.now()
+        calendar_widget = self.step('calendar_widget_init', lambda: CalendarWidget(calendar_url=url))
+        self.step('compute_occurrences_for_month', calendar_widget.compute_occurrences_for_month,
+                  now.month, now.year)
+        self.step('render_month', self.render_month, calendar_widget, now.month, now.year)
+        upcoming_widget = self.step('upcoming_widget_init', lambda: UpcomingEventsWidget(calendar_url=url))
+        self.step('render_events', upcoming_widget.render_events)
+
+    def load_repository(self, repository, records):
+        repository.events = records
+        repository.occurrences.update(records)
+        repository.loaded = True
+
+    def render_month(self, widget, month, year):
+        # render_month only schedules the work; run the pass it schedules.
+        widget.render_month(month, year)
+        widget._render_pass(0)
+
+
+def edit_calendar(calendar, size):
+    """Edit, delete and add max(1, size // 100) events each."""
+    count = max(1, size // 100)
+    names = list(calendar.objects)
+    for name in names[:count]:
+        calendar.put(name, calendar.objects[name].replace('SUMMARY:Event', 'SUMMARY:Edited event', 1))
+    for name in names[count:2 * count]:
+        calendar.delete(name)
+    rng = random.Random(2)
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    for i in range(size, size + count):
+        uid, text = synthetic_event(i, rng, now)
+        calendar.put(f'{uid.split("@")[0]}.ics', text)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return 'unknown'
+
+
+def compare(old_path, new):
+    with open(old_path, 'r') as f:
+        old = json.load(f)
+    print(f"\nCompared with {old['revision']} ({old_path}):")
+    for size, steps in new['results'].items():
+        for name, seconds in steps.items():
+            before = old['results'].get(size, {}).get(name)
+            if not isinstance(seconds, float) or not isinstance(before, float):
+                continue
+            ratio = seconds / before if before else float('inf')
+            flag = '  <-- slower' if ratio > 1.1 else ''
+            print(f"  {size:>7} {name:<34} {before * 1000:10.1f} -> {seconds * 1000:10.1f} ms "
+                  f"({ratio:5.2f}x){flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='100,1000,10000',
+                        help='comma-separated corpus sizes, up to 100000')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-ui', action='store_true', help='skip the Kivy widget steps')
+    parser.add_argument('--out', default=None, help='result file (default: benchmarks/results/...)')
+    parser.add_argument('--compare', default=None, help='earlier result file to compare against')
+    args = parser.parse_args()
+
+    if not args.no_ui:
+        use_headless_window()
+
+    revision = git_revision()
+    output = {
+        'revision': revision,
+        'time': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': {},
+    }
+    for size in [int(size) for size in args.sizes.split(',') if size.strip()]:
+        output['results'][str(size)] = Suite(size, args.repeat, not args.no_ui).run()
+
+    path = args.out or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{revision}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f"\nSaved results to {path}")
+
+    if args.compare:
+        compare(args.compare, output)
+
+
+if __name__ == '__main__':
+    main()
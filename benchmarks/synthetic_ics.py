@@ -0,0 +1,118 @@
+"""
+Synthetic calendar corpora for the benchmarks: one VCALENDAR resource per
+event, with a reproducible mix of timed, all-day, zoned, recurring
+(daily/weekly/monthly, COUNT/UNTIL), EXDATE'd and overridden events.
+
+    python benchmarks/synthetic_ics.py --events 1000 --out /tmp/corpus
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+ZONES = [None, 'America/New_York', 'Europe/Berlin', 'Asia/Tokyo']
+RULES = [
+    'FREQ=DAILY',
+    'FREQ=DAILY;INTERVAL=2;COUNT=60',
+    'FREQ=WEEKLY;BYDAY=MO,WE,FR',
+    'FREQ=WEEKLY;UNTIL={until}',
+    'FREQ=MONTHLY;BYMONTHDAY=15',
+    'FREQ=YEARLY',
+]
+
+
+def _stamp(dt):
+    return dt.strftime('%Y%m%dT%H%M%S')
+
+
+def _value(dt, zone, all_day):
+    if all_day:
+        return dt.strftime('%Y%m%d')
+    return _stamp(dt) if zone else _stamp(dt) + 'Z'
+
+
+def _dtstart(name, dts, zone, all_day):
+    # One property with one or more comma-separated values.
+    dts = dts if isinstance(dts, list) else [dts]
+    values = ','.join(_value(dt, zone, all_day) for dt in dts)
+    if all_day:
+        return f"{name};VALUE=DATE:{values}"
+    if zone:
+        return f"{name};TZID={zone}:{values}"
+    return f"{name}:{values}"
+
+
+def synthetic_event(i, rng, now):
+    """Return (uid, ics text) of the i-th event."""
+    uid = f'bench-{i}@mirrormind'
+    all_day = rng.random() < 0.15
+    zone = None if all_day else rng.choice(ZONES)
+    start = (now + timedelta(days=rng.randint(-400, 200), hours=rng.randint(6, 20))).replace(
+        minute=rng.choice((0, 15, 30, 45)), second=0, microsecond=0)
+    if all_day:
+        start = start.replace(hour=0, minute=0)
+    duration = timedelta(days=1) if all_day else timedelta(minutes=rng.choice((15, 30, 60, 90)))
+
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{uid}',
+        f'DTSTAMP:{_stamp(now)}Z',
+        _dtstart('DTSTART', start, zone, all_day),
+        _dtstart('DTEND', start + duration, zone, all_day),
+        f'SUMMARY:Event {i}',
+        f'LOCATION:Room {rng.randint(1, 40)}',
+    ]
+    overrides = []
+    if rng.random() < 0.3:
+        # UNTIL is a DATE for all-day series and a UTC time otherwise.
+        until = _value(start + timedelta(days=rng.randint(30, 720)), None, all_day)
+        lines.append('RRULE:' + rng.choice(RULES).format(until=until))
+        if rng.random() < 0.5:
+            skipped = [start + timedelta(days=7 * k) for k in rng.sample(range(1, 30), 3)]
+            lines.append(_dtstart('EXDATE', sorted(skipped), zone, all_day))
+        if rng.random() < 0.2 and not all_day:
+            moved = start + timedelta(days=7)
+            overrides = [
+                'BEGIN:VEVENT',
+                f'UID:{uid}',
+                f'DTSTAMP:{_stamp(now)}Z',
+                _dtstart('RECURRENCE-ID', moved, zone, all_day),
+                _dtstart('DTSTART', moved + timedelta(hours=2), zone, all_day),
+                _dtstart('DTEND', moved + timedelta(hours=2) + duration, zone, all_day),
+                f'SUMMARY:Event {i} (moved)',
+                'END:VEVENT',
+            ]
+    lines.append('END:VEVENT')
+
+    body = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//mirrormind//bench//EN']
+    body += lines + overrides + ['END:VCALENDAR', '']
+    return uid, '\r\n'.join(body)
+
+
+def synthetic_corpus(count, seed=1, now=None):
+    """Return {filename: ics text} for count events."""
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    corpus = {}
+    for i in range(count):
+        uid, text = synthetic_event(i, rng, now)
+        corpus[f'{uid.split("@")[0]}.ics'] = text
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for name, text in synthetic_corpus(args.events, args.seed).items():
+        with open(os.path.join(args.out, name), 'w', newline='') as f:
+            f.write(text)
+    print(f"Wrote {args.events} events to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
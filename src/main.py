@@ -1,29 +1,98 @@
+import time
+STARTED = time.perf_counter()
+
+import os
+import threading
+from dotenv import load_dotenv
+
+# Load the .env file once, before any module reads the environment.
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+
 from kivy.app import App
 from kivy.lang import Builder
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.clock import Clock
 from kivy.core.window import Window
-from recognition.face_recognition import start_recognition
-from widgets.calendar_widget import CalendarWidget
+from widgets.base_widget import WidgetCard
+from widgets.dashboard_layout import DashboardLayout
 from widgets.grid_overlay import GridOverlay
-from widgets.upcoming_events_widget import UpcomingEventsWidget
+from widgets.startup_timer import StartupTimer
+from widgets.profiler import profiler
+from widgets.profile_dashboards import DEFAULT_DASHBOARD
+from profiles.profile_assets import ProfileAssets, DEFAULT_PROFILE
+from profiles.profile_manager import load_profile
+
+# The calendar widgets pull in caldav, icalendar, dateutil, requests and
+# the SQLite cache; in the default staged startup they are imported on a
+# worker thread after the first frame (MIRRORMIND_STARTUP=eager imports
+# them up front instead). Face recognition, which imports OpenCV, also
+# starts after the first frame.
+STARTUP_STAGES = ('kivy ready', 'shell built', 'first frame', 'calendar stack loaded',
+                  'widgets created', 'first events shown')
+startup = StartupTimer(STARTED, expected=STARTUP_STAGES)
+startup.mark('kivy ready')
 
 # Explicitly load the KV file if its name does not follow auto-load conventions.
 Builder.load_file('src/main.kv')
 
+def load_calendar_stack():
+    """
+    Import the calendar data stack and start fetching, so the repository
+    is already loading the cache and talking to the server by the time the
+    widgets subscribe. Safe to call from a worker thread.
+    """
+    from widgets.event_repository import get_event_repository
+
+    get_event_repository().refresh()
+    startup.mark('calendar stack loaded')
+
 class DashboardScreen(Screen):
     def on_kv_post(self, base_widget):
         # Confirm IDs are loaded.
         print("DashboardScreen IDs:", self.ids)
 
-    def update_profile(self, profile_name):
-        # Update the background image based on the profile.
-        if profile_name == "user1":
-            bg_source = "assets/user1_bg.jpg"
-        else:
-            bg_source = "assets/guest_bg.jpg"
-        self.ids.bg_image.source = bg_source
-        self.ids.profile_label.text = f"Profile: {profile_name}"
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Decoded backgrounds and settings of recently seen profiles.
+        self.assets = ProfileAssets()
+        # Each profile's cards, kept warm; None until the widgets load.
+        self.dashboards = None
+        self.profile_name = DEFAULT_PROFILE
+        self._pending_profile = None
+        self._switch_requested_at = None
+
+    def update_profile(self, profile_name, requested_at=None):
+        """
+        Switch to a profile. The switch commits once the profile's assets
+        are decoded (immediately if they are cached); until then the current
+        background stays up. requested_at is the perf_counter() time the
+        switch was asked for, used to report its latency.
+        """
+        self._pending_profile = profile_name
+        self._switch_requested_at = requested_at or time.perf_counter()
+        self.assets.preload(profile_name, self._commit_profile)
+
+    def _commit_profile(self, bundle):
+        # A newer switch may have been requested while this one loaded.
+        if bundle.name != self._pending_profile:
+            return
+        self._pending_profile = None
+        self.profile_name = bundle.name
+        if bundle.texture is not None:
+            self.ids.bg_image.texture = bundle.texture
+        self.ids.profile_label.text = f"Profile: {bundle.name}"
+        if self.dashboards is not None:
+            self.dashboards.show(bundle.name)
+        Window.bind(on_flip=self._on_switch_drawn)
+
+    def _on_switch_drawn(self, *args):
+        Window.unbind(on_flip=self._on_switch_drawn)
+        if self._switch_requested_at is None:
+            return
+        latency = time.perf_counter() - self._switch_requested_at
+        self._switch_requested_at = None
+        profiler.record('profile_switch', latency)
+        print(f"Switched to profile '{self.profile_name}' in {latency * 1000:.0f} ms.")
 
 class SettingsScreen(Screen):
     pass
@@ -36,8 +105,8 @@ class MirrorMindApp(App):
         self.sm.add_widget(self.dashboard)
         self.sm.add_widget(self.settings)
         
-        start_recognition(self.on_profile_update)
         Clock.schedule_interval(lambda dt: self.check_for_profile_update(), 1)
+        startup.mark('shell built')
         return self.sm
 
     def on_start(self):
@@ -50,22 +119,104 @@ class MirrorMindApp(App):
         # Add overlay to dashboard so it is drwan above other widgets
         self.dashboard.add_widget(grid_overlay)
 
+        # Decode the guest background before the first switch back to it.
+        self.dashboard.assets.preload(DEFAULT_PROFILE)
+
+        # MIRRORMIND_PROFILE=1 shows frame and render timings on screen and
+        # appends them to src/cache/profile.jsonl every
+        # MIRRORMIND_PROFILE_DUMP seconds (0 disables the file).
+        if os.getenv("MIRRORMIND_PROFILE", "").lower() in ("1", "true", "yes"):
+            self.enable_profiling(float(os.getenv("MIRRORMIND_PROFILE_DUMP", 60)))
+
+        self.grid_overlay = grid_overlay
+        self.show_placeholders()
+        Window.bind(on_flip=self._on_first_flip)
+
+        if os.getenv("MIRRORMIND_STARTUP", "staged").lower() == "eager":
+            load_calendar_stack()
+            self.create_widgets()
+        else:
+            # Let the shell reach the screen first; import and start
+            # fetching in the background, then build the cards.
+            threading.Thread(target=self._load_in_background, daemon=True).start()
+
+    def _on_first_flip(self, *args):
+        Window.unbind(on_flip=self._on_first_flip)
+        startup.mark('first frame')
+        threading.Thread(target=self.start_recognition, daemon=True).start()
+
+    def start_recognition(self):
+        from recognition.face_recognition import start_recognition
+
+        start_recognition(self.on_profile_update)
+
+    def show_placeholders(self):
+        """
+        Draw empty cards where the profile's saved layout puts its cards,
+        so the dashboard has its final shape before the calendar stack
+        loads. create_widgets() replaces them with the real cards.
+        """
+        self.placeholders = DashboardLayout(grid_size=(12, 12))
+        widget_grid = self.dashboard.ids.get('widget_grid')
+        if not widget_grid:
+            return
+        settings = load_profile(self.dashboard.profile_name) or {}
+        for entry in settings.get('dashboard') or DEFAULT_DASHBOARD:
+            card = WidgetCard(grid_size=(12, 12), grid_width=entry.get('grid_width', 1),
+                              grid_height=entry.get('grid_height', 1))
+            widget_grid.add_widget(card)
+            self.placeholders.register(card, entry.get('col'), entry.get('row'))
+
+    def hide_placeholders(self, widget_grid):
+        for card in list(self.placeholders.cards):
+            self.placeholders.unregister(card)
+            card.release()
+            widget_grid.remove_widget(card)
+        self.placeholders.release()
+
+    def _load_in_background(self):
+        try:
+            load_calendar_stack()
+        except Exception as e:
+            print(f"Failed to load the calendar widgets: {e}")
+            return
+        Clock.schedule_once(lambda dt: self.create_widgets())
+
+    def create_widgets(self):
+        from widgets.event_repository import get_event_repository
+        from widgets.profile_dashboards import ProfileDashboards
+
         # Ensure that widget_grid exists before accessing it.
         widget_grid = self.dashboard.ids.get('widget_grid')
-        if widget_grid:
-            cal1 = CalendarWidget(grid_size=(12, 12), grid_width=6, grid_height=6,)
-            widget_grid.add_widget(cal1)
-            cal1.overlay = grid_overlay
-            
-            cal2 = UpcomingEventsWidget(grid_size=(12, 12), grid_width=3, grid_height=12)
-            widget_grid.add_widget(cal2)
-            cal2.overlay = grid_overlay
-        else:
+        if not widget_grid:
             print("widget_grid not found in dashboard.ids")
+            return
+
+        # Every profile gets its own cards and layout, built on first sight
+        # and swapped in on recognition.
+        self.hide_placeholders(widget_grid)
+        self.dashboard.dashboards = ProfileDashboards(widget_grid, self.grid_overlay, grid_size=(12, 12))
+        self.dashboard.dashboards.show(self.dashboard.profile_name)
+        startup.mark('widgets created')
+
+        # Subscribed after the cards, so this runs right after they get data.
+        self.repository = get_event_repository()
+        self.repository.subscribe(self._on_first_events)
+
+    def _on_first_events(self, events, diff=None):
+        startup.mark('first events shown')
+        self.repository.unsubscribe(self._on_first_events)
+
+    def enable_profiling(self, dump_interval=60):
+        from widgets.profiler_hud import ProfilerHUD
+        self.profiler_hud = ProfilerHUD(dump_interval=dump_interval, pos=(10, 10))
+        self.dashboard.add_widget(self.profiler_hud)
 
     def on_profile_update(self, profile_name):
-        # Schedule the UI update to run on the main thread
-        Clock.schedule_once(lambda dt: self.dashboard.update_profile(profile_name))
+        # Schedule the UI update to run on the main thread; the latency of
+        # the switch is measured from here to the first frame showing it.
+        requested_at = time.perf_counter()
+        Clock.schedule_once(lambda dt: self.dashboard.update_profile(profile_name, requested_at))
 
     def check_for_profile_update(self):
         pass
@@ -0,0 +1,206 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from profiles.profile_manager import PROFILE_DIR
+
+# Cosine similarity above which an SFace embedding matches (OpenCV's suggestion).
+DEFAULT_THRESHOLD = 0.363
+
+
+class EmbeddingStore:
+    """
+    Reference face embeddings of the enrolled profiles.
+
+    All embeddings live L2-normalised in one contiguous float32 matrix,
+    memory-mapped from embeddings.f32 so it is shared with the page cache
+    instead of being parsed at startup. Row i belongs to names[i] and
+    optionally has a caller-chosen source key in row_sources[i], such as
+    the reference photo it came from; the row count, names, sources and
+    per-profile thresholds are kept in embeddings.json. Matching a frame
+    is a single matrix product against every reference at once.
+
+    Enrolling appends a row (the file doubles in capacity when full) and
+    removing a profile moves the last rows into its slots, so neither
+    rewrites or reloads the whole index.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, dim=128, capacity=64, default_threshold=DEFAULT_THRESHOLD):
+        self.directory = directory
+        self.matrix_path = os.path.join(directory, 'embeddings.f32')
+        self.meta_path = os.path.join(directory, 'embeddings.json')
+        self.dim = dim
+        self.default_threshold = default_threshold
+        self.names = []
+        self.row_sources = []  # source key of each row, or None
+        self.thresholds = {}  # profile -> threshold, when not the default
+        self._lock = threading.RLock()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._load(capacity)
+
+    def _load(self, capacity):
+        meta = None
+        if os.path.exists(self.meta_path) and os.path.exists(self.matrix_path):
+            try:
+                with open(self.meta_path, 'r') as f:
+                    meta = json.load(f)
+            except ValueError as e:
+                print(f"Failed to read {self.meta_path}, starting an empty store: {e}")
+        if meta:
+            self.dim = meta['dim']
+            self.names = meta['names']
+            self.row_sources = meta.get('sources') or [None] * len(self.names)
+            self.thresholds = meta.get('thresholds', {})
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r+',
+                                     shape=(meta['capacity'], self.dim))
+        else:
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='w+',
+                                     shape=(capacity, self.dim))
+            self._save_meta()
+        self._row_thresholds = np.array([self.threshold_for(name) for name in self.names], dtype=np.float32)
+
+    @property
+    def count(self):
+        return len(self.names)
+
+    def profiles(self):
+        with self._lock:
+            return sorted(set(self.names))
+
+    def sources(self):
+        """Source keys of every enrolled row that has one."""
+        with self._lock:
+            return {source for source in self.row_sources if source is not None}
+
+    def threshold_for(self, name):
+        return self.thresholds.get(name, self.default_threshold)
+
+    def set_threshold(self, name, threshold):
+        with self._lock:
+            if threshold is None:
+                self.thresholds.pop(name, None)
+            else:
+                self.thresholds[name] = float(threshold)
+            rows = [i for i, row_name in enumerate(self.names) if row_name == name]
+            self._row_thresholds[rows] = self.threshold_for(name)
+            self._save_meta()
+
+    def enroll(self, name, embedding, source=None):
+        """Add one reference embedding for profile name, optionally tagged with a source key."""
+        vector = self._normalise(embedding)
+        with self._lock:
+            if self.count == self._matrix.shape[0]:
+                self._grow()
+            self._matrix[self.count] = vector
+            self._matrix.flush()
+            self.names.append(name)
+            self.row_sources.append(source)
+            self._row_thresholds = np.append(self._row_thresholds, np.float32(self.threshold_for(name)))
+            self._save_meta()
+
+    def remove(self, name):
+        """Forget every reference embedding of profile name."""
+        with self._lock:
+            self._remove_rows([i for i, row_name in enumerate(self.names) if row_name == name])
+            self.thresholds.pop(name, None)
+            self._save_meta()
+
+    def remove_source(self, source):
+        """Forget the reference embeddings enrolled with this source key."""
+        with self._lock:
+            self._remove_rows([i for i, row_source in enumerate(self.row_sources) if row_source == source])
+            self._save_meta()
+
+    def _remove_rows(self, rows):
+        # Fill each freed slot, highest first, with the current last row.
+        for row in reversed(rows):
+            last = self.count - 1
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self.names[row] = self.names[last]
+                self.row_sources[row] = self.row_sources[last]
+                self._row_thresholds[row] = self._row_thresholds[last]
+            self.names.pop()
+            self.row_sources.pop()
+        self._row_thresholds = self._row_thresholds[:self.count].copy()
+        self._matrix.flush()
+
+    def scores(self, embeddings):
+        """Cosine similarities, one row per given embedding, one column per reference."""
+        queries = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            return queries @ self._matrix[:self.count].T
+
+    def match(self, embedding):
+        """Return (profile, similarity) of the best reference above its
+        profile's threshold, or (None, best similarity)."""
+        matches = self.match_many([embedding])
+        return matches[0] if matches else (None, 0.0)
+
+    def match_many(self, embeddings):
+        """match() for every face of a frame with one matrix product."""
+        if not len(embeddings):
+            return []
+        with self._lock:
+            if not self.count:
+                return [(None, 0.0) for _ in embeddings]
+            scores = self.scores(embeddings)
+            passing = np.where(scores >= self._row_thresholds, scores, -np.inf)
+            names = list(self.names)
+        results = []
+        for row_scores, row_passing in zip(scores, passing):
+            best = int(np.argmax(row_passing))
+            if np.isfinite(row_passing[best]):
+                results.append((names[best], float(row_scores[best])))
+            else:
+                results.append((None, float(row_scores.max())))
+        return results
+
+    def top_k(self, embedding, k=5):
+        """The k most similar profiles as [(profile, similarity)], best first."""
+        with self._lock:
+            if not self.count:
+                return []
+            scores = self.scores([embedding])[0]
+            names = list(self.names)
+        # Several references per profile: keep each profile's best.
+        order = np.argsort(-scores)
+        best = {}
+        for row in order:
+            if names[row] not in best:
+                best[names[row]] = float(scores[row])
+                if len(best) == k:
+                    break
+        return list(best.items())
+
+    def _normalise(self, embedding):
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        if vector.shape[0] != self.dim:
+            raise ValueError(f"expected a {self.dim}-dimensional embedding, got {vector.shape[0]}")
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _grow(self):
+        # Double the file in place; existing rows stay where they are.
+        capacity = max(self._matrix.shape[0] * 2, 1)
+        self._matrix.flush()
+        del self._matrix
+        with open(self.matrix_path, 'r+b') as f:
+            f.truncate(capacity * self.dim * np.dtype(np.float32).itemsize)
+        self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+
+    def _save_meta(self):
+        meta = {
+            'dim': self.dim,
+            'capacity': int(self._matrix.shape[0]),
+            'names': self.names,
+            'sources': self.row_sources,
+            'thresholds': self.thresholds,
+        }
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
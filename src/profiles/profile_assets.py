@@ -0,0 +1,114 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from kivy.clock import Clock
+from kivy.loader import Loader
+from profiles.profile_manager import load_profile
+
+# Paths are relative to the project root, where the app is started.
+ASSETS_DIR = 'assets'
+DEFAULT_PROFILE = 'guest'
+
+
+def background_path(profile_name, settings=None):
+    """The profile's configured background, assets/<name>_bg.jpg, or the guest one."""
+    if settings and settings.get('background'):
+        return settings['background']
+    path = os.path.join(ASSETS_DIR, f'{profile_name}_bg.jpg')
+    if os.path.exists(path):
+        return path
+    return os.path.join(ASSETS_DIR, f'{DEFAULT_PROFILE}_bg.jpg')
+
+
+class ProfileBundle:
+    """Everything a profile switch needs, ready to apply: settings and decoded background."""
+
+    def __init__(self, name):
+        self.name = name
+        self.settings = {}
+        self.background = None  # kivy.loader ProxyImage
+        self.ready = False
+        self._waiting = []
+
+    @property
+    def texture(self):
+        return self.background.texture if self.background is not None else None
+
+
+class ProfileAssets:
+    """
+    LRU of ProfileBundles for the most recently seen profiles.
+
+    Settings are read on a worker thread and backgrounds are decoded by
+    kivy.loader's worker threads, so the main thread only ever uploads a
+    finished image as a texture. A switch to a cached profile is just a
+    texture swap.
+    """
+
+    def __init__(self, max_profiles=4):
+        self.max_profiles = max_profiles
+        self._bundles = OrderedDict()
+        self._pool = ThreadPoolExecutor(max_workers=1)
+
+    def get(self, profile_name):
+        """The ready bundle of a profile, or None if it is not loaded yet."""
+        bundle = self._bundles.get(profile_name)
+        if bundle is None or not bundle.ready:
+            return None
+        self._bundles.move_to_end(profile_name)
+        return bundle
+
+    def preload(self, profile_name, on_ready=None):
+        """
+        Load a profile's bundle in the background and call on_ready(bundle)
+        on the main thread once its background can be drawn. Main thread only.
+        """
+        bundle = self._bundles.get(profile_name)
+        if bundle is not None:
+            self._bundles.move_to_end(profile_name)
+            if bundle.ready:
+                if on_ready:
+                    on_ready(bundle)
+                return bundle
+            if on_ready:
+                bundle._waiting.append(on_ready)
+            return bundle
+
+        bundle = ProfileBundle(profile_name)
+        if on_ready:
+            bundle._waiting.append(on_ready)
+        self._bundles[profile_name] = bundle
+        while len(self._bundles) > self.max_profiles:
+            self._bundles.popitem(last=False)
+
+        future = self._pool.submit(self._read_settings, profile_name)
+        future.add_done_callback(
+            lambda future: Clock.schedule_once(lambda dt: self._settings_loaded(bundle, future))
+        )
+        return bundle
+
+    def _read_settings(self, profile_name):
+        settings = load_profile(profile_name) or {}
+        return settings, background_path(profile_name, settings)
+
+    def _settings_loaded(self, bundle, future):
+        try:
+            bundle.settings, path = future.result()
+        except Exception as e:
+            print(f"Failed to load profile '{bundle.name}': {e}")
+            bundle.settings, path = {}, background_path(bundle.name)
+        bundle.background = Loader.image(path)
+        if bundle.background.loaded:
+            self._mark_ready(bundle)
+        else:
+            # A broken image still completes the switch, with Kivy's error image.
+            bundle.background.bind(on_load=lambda proxy: self._mark_ready(bundle),
+                                   on_error=lambda proxy: self._mark_ready(bundle))
+
+    def _mark_ready(self, bundle):
+        if bundle.ready:
+            return
+        bundle.ready = True
+        waiting, bundle._waiting = bundle._waiting, []
+        for callback in waiting:
+            callback(bundle)
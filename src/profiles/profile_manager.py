@@ -1,18 +1,220 @@
+import atexit
 import json
 import os
+import pickle
+import threading
 
 PROFILE_DIR = os.path.join(os.path.dirname(__file__), 'profiles_data')
 
-def load_profile(profile_name):
-    path = os.path.join(PROFILE_DIR, f'{profile_name}.json')
-    if os.path.exists(path):
+# 'json' keeps profiles human-editable; 'pickle' stores them in a compact
+# binary form that loads far faster once profiles hold many layouts.
+FORMATS = {'json': '.json', 'pickle': '.pickle'}
+
+
+class ProfileStore:
+    """
+    Profile files with an in-memory cache.
+
+    A loaded profile stays cached together with the (mtime, size) of its
+    file, so later loads only stat the file and re-read it when something
+    else changed it. Callers get the cached dict itself and should treat
+    it as read-only, passing their changes to save().
+
+    Saves write a temporary file and rename it over the profile, so a
+    crash never leaves a half-written profile behind. schedule_save()
+    debounces bursts of changes (dragging cards around) into one write
+    per profile, `delay` seconds after the last change.
+
+    watch() calls back with the new data when a profile file is changed
+    by something other than this store, e.g. edited by hand.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, fmt=None, delay=None, watch_interval=None):
+        self.directory = directory
+        self.format = fmt or os.getenv('PROFILE_FORMAT', 'json').lower()
+        if self.format not in FORMATS:
+            print(f"Unknown PROFILE_FORMAT '{self.format}', using json.")
+            self.format = 'json'
+        self.delay = float(os.getenv('PROFILE_SAVE_DELAY', 2)) if delay is None else delay
+        self.watch_interval = (float(os.getenv('PROFILE_WATCH_INTERVAL', 2))
+                               if watch_interval is None else watch_interval)
+        self._cache = {}    # name -> ((path, (mtime_ns, size)), data)
+        self._pending = {}  # name -> data waiting for the debounced save
+        self._watchers = {}  # name -> [callback]
+        self._lock = threading.RLock()
+        self._timer = None
+        self._watch_thread = None
+        self._stopped = threading.Event()
+        atexit.register(self.flush)
+
+    def path(self, profile_name, fmt=None):
+        return os.path.join(self.directory, profile_name + FORMATS[fmt or self.format])
+
+    def _find(self, profile_name):
+        """Path and stamp of the profile's file, preferring the configured format."""
+        for fmt in [self.format] + [other for other in FORMATS if other != self.format]:
+            path = self.path(profile_name, fmt)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            return path, (stat.st_mtime_ns, stat.st_size)
+        return None, None
+
+    def load(self, profile_name):
+        """The profile's data, or None if it has none."""
+        with self._lock:
+            if profile_name in self._pending:
+                return self._pending[profile_name]
+            path, stamp = self._find(profile_name)
+            if path is None:
+                self._cache.pop(profile_name, None)
+                return None
+            cached = self._cache.get(profile_name)
+            if cached is not None and cached[0] == (path, stamp):
+                return cached[1]
+            data = self._read(path)
+            self._cache[profile_name] = ((path, stamp), data)
+            return data
+
+    def _read(self, path):
+        if path.endswith(FORMATS['pickle']):
+            with open(path, 'rb') as f:
+                return pickle.load(f)
         with open(path, 'r') as f:
             return json.load(f)
-    return None
-
-def save_profile(profile_name, profile_data):
-    if not os.path.exists(PROFILE_DIR):
-        os.makedirs(PROFILE_DIR)
-    path = os.path.join(PROFILE_DIR, f'{profile_name}.json')
-    with open(path, 'w') as f:
-        json.dump(profile_data, f, indent=4)
\ No newline at end of file
+
+    def save(self, profile_name, profile_data):
+        """Write the profile now, replacing its file atomically."""
+        with self._lock:
+            self._pending.pop(profile_name, None)
+            self._write(profile_name, profile_data)
+
+    def schedule_save(self, profile_name, profile_data):
+        """Save the profile once no further changes come in for `delay` seconds."""
+        with self._lock:
+            self._pending[profile_name] = profile_data
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Write every profile with a scheduled save in one batch."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, {}
+            for profile_name, profile_data in pending.items():
+                try:
+                    self._write(profile_name, profile_data)
+                except OSError as e:
+                    print(f"Failed to save profile '{profile_name}': {e}")
+
+    def _write(self, profile_name, profile_data):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        path = self.path(profile_name)
+        tmp_path = path + '.tmp'
+        if self.format == 'pickle':
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(profile_data, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            with open(tmp_path, 'w') as f:
+                json.dump(profile_data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        # Drop a copy in the other format, which a later PROFILE_FORMAT
+        # switch would otherwise load instead of this one.
+        for fmt in FORMATS:
+            if fmt != self.format and os.path.exists(self.path(profile_name, fmt)):
+                os.remove(self.path(profile_name, fmt))
+        stat = os.stat(path)
+        # Our own write must not look like an outside change to watch().
+        self._cache[profile_name] = ((path, (stat.st_mtime_ns, stat.st_size)), profile_data)
+
+    def invalidate(self, profile_name=None):
+        """Drop one cached profile, or all of them, so the next load re-reads the file."""
+        with self._lock:
+            if profile_name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(profile_name, None)
+
+    def watch(self, profile_name, callback):
+        """Call callback(profile_name, data) on a background thread when the
+        profile's file is changed outside this store."""
+        with self._lock:
+            self.load(profile_name)
+            self._watchers.setdefault(profile_name, []).append(callback)
+            if self._watch_thread is None:
+                self._watch_thread = threading.Thread(target=self._watch_loop, daemon=True)
+                self._watch_thread.start()
+
+    def unwatch(self, profile_name, callback):
+        with self._lock:
+            callbacks = self._watchers.get(profile_name, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._watchers.pop(profile_name, None)
+
+    def _watch_loop(self):
+        while not self._stopped.wait(self.watch_interval):
+            self.poll()
+
+    def poll(self):
+        """Check watched profiles for outside changes and notify their watchers."""
+        changed = []
+        with self._lock:
+            for profile_name, callbacks in list(self._watchers.items()):
+                cached = self._cache.get(profile_name)
+                path, stamp = self._find(profile_name)
+                current = (path, stamp) if path is not None else None
+                if cached is not None and cached[0] == current:
+                    continue
+                if cached is None and current is None:
+                    continue
+                try:
+                    data = self.load(profile_name)
+                except (OSError, ValueError, pickle.UnpicklingError) as e:
+                    # Probably caught mid-edit; try again on the next poll.
+                    print(f"Failed to reload profile '{profile_name}': {e}")
+                    continue
+                changed.append((profile_name, data, list(callbacks)))
+        for profile_name, data, callbacks in changed:
+            for callback in callbacks:
+                callback(profile_name, data)
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_profile_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ProfileStore()
+        return _store
+
+
+def load_profile(profile_name):
+    return get_profile_store().load(profile_name)
+
+
+def save_profile(profile_name, profile_data, debounce=False):
+    store = get_profile_store()
+    if debounce:
+        store.schedule_save(profile_name, profile_data)
+    else:
+        store.save(profile_name, profile_data)
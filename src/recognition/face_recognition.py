@@ -1,5 +1,19 @@
+import os
 import threading
 import time
+from collections import deque
+
+try:
+    import cv2
+    import numpy as np
+except ImportError:
+    cv2 = None
+    np = None
+
+# Reference photos, one directory per profile: faces/<profile>/*.jpg
+REFERENCE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'profiles', 'faces')
+
+GUEST = "guest"
 
 # Simulated current profile variable at the module level.
 _current_profile = "guest"
@@ -9,12 +23,397 @@ def recognition_loop(update_callback):
     while True:
         # For simulation: alternate between "guest" and "user1".
         new_profile = "user1" if _current_profile == "guest" else "guest"
-        
+
         if new_profile != _current_profile:
             _current_profile = new_profile
             update_callback(_current_profile)
         time.sleep(5)  # Adjust the interval as needed.
 
+
+class DropOldestQueue:
+    """
+    A bounded queue between pipeline stages. When it is full, put() drops
+    the oldest item instead of blocking, so a slow stage sees the newest
+    frames and latency never builds up behind it. put(block=True) waits
+    for space instead, for offline runs where every item must be handled.
+    """
+
+    def __init__(self, maxsize=2):
+        self._items = deque(maxlen=maxsize)
+        self._condition = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item, block=False):
+        with self._condition:
+            if block:
+                while len(self._items) == self._items.maxlen and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._condition.notify_all()
+
+    def get(self, timeout=None):
+        """Next item, or None once closed or after timeout seconds."""
+        with self._condition:
+            if not self._items and not self._closed:
+                self._condition.wait(timeout)
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            # Wake a producer blocked in put(block=True).
+            self._condition.notify_all()
+            return item
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class FrameSource:
+    """
+    Capture stage: reads a camera (an integer index) or a video file,
+    keeps one frame in every frame_skip + 1, downscales it to at most
+    max_width pixels wide and hands it on as (timestamp, frame).
+
+    Video files are paced to their own frame rate when realtime is True,
+    so a recording behaves like a camera, frames included that get
+    dropped when the workers fall behind. With realtime False every kept
+    frame waits for room in the queue instead, so the whole file is
+    analysed, as fast as the workers go, with repeatable results.
+    """
+
+    def __init__(self, source, output, frame_skip=2, max_width=320, realtime=True, loop=False):
+        self.source = source
+        self.output = output
+        self.frame_skip = frame_skip
+        self.max_width = max_width
+        self.realtime = realtime
+        self.loop = loop
+        self.frames_read = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def is_camera(self):
+        return isinstance(self.source, int) or str(self.source).isdigit()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        capture = cv2.VideoCapture(int(self.source) if self.is_camera else self.source)
+        if not capture.isOpened():
+            print(f"Failed to open video source {self.source}")
+            self.output.close()
+            return
+        if self.is_camera:
+            # Keep the driver from queueing stale frames of its own.
+            capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30
+        pace = self.realtime and not self.is_camera
+        started = time.monotonic()
+        index = 0
+        try:
+            while not self._stopped.is_set():
+                keep = index % (self.frame_skip + 1) == 0
+                # Skipped frames are grabbed but never decoded.
+                ok = capture.grab()
+                frame = None
+                if ok and keep:
+                    ok, frame = capture.retrieve()
+                if not ok:
+                    if self.loop and not self.is_camera:
+                        capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    break
+                self.frames_read += 1
+                timestamp = time.monotonic() - started if self.is_camera else index / fps
+                if pace:
+                    delay = started + index / fps - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                index += 1
+                if keep:
+                    self.output.put((timestamp, self._downscale(frame)),
+                                    block=not self.realtime and not self.is_camera)
+        finally:
+            capture.release()
+            self.output.close()
+
+    def _downscale(self, frame):
+        height, width = frame.shape[:2]
+        if width <= self.max_width:
+            return frame
+        scale = self.max_width / width
+        return cv2.resize(frame, (self.max_width, int(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+class FaceAnalyzer:
+    """
+    Detection-then-embedding for one frame. Uses OpenCV's YuNet detector
+    and SFace recognizer when their ONNX models are configured; without a
+    detector model it falls back to a Haar cascade, and without a
+    recognizer model it can only report that faces are present.
+    OpenCV's face models are not thread-safe, so every worker thread gets
+    its own instances.
+    """
+
+    def __init__(self, detector_model=None, recognizer_model=None):
+        self.detector_model = detector_model
+        self.recognizer_model = recognizer_model
+        self._local = threading.local()
+
+    @property
+    def can_identify(self):
+        return bool(self.detector_model and self.recognizer_model)
+
+    def _models(self):
+        local = self._local
+        if not hasattr(local, 'detector'):
+            if self.detector_model:
+                local.detector = cv2.FaceDetectorYN.create(self.detector_model, '', (320, 320))
+            else:
+                local.detector = cv2.CascadeClassifier(
+                    os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml'))
+            local.recognizer = (cv2.FaceRecognizerSF.create(self.recognizer_model, '')
+                                if self.can_identify else None)
+        return local.detector, local.recognizer
+
+    def analyze(self, frame):
+        """Return (faces found, [embedding, ...]) for a BGR frame."""
+        detector, recognizer = self._models()
+        if not self.detector_model:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            faces = detector.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=5)
+            return len(faces), []
+
+        height, width = frame.shape[:2]
+        detector.setInputSize((width, height))
+        _ok, faces = detector.detect(frame)
+        if faces is None:
+            return 0, []
+        if recognizer is None:
+            return len(faces), []
+        embeddings = []
+        # Largest faces first; they are the people closest to the mirror.
+        for face in sorted(faces, key=lambda f: f[2] * f[3], reverse=True)[:2]:
+            aligned = recognizer.alignCrop(frame, face)
+            embeddings.append(recognizer.feature(aligned).flatten())
+        return len(faces), embeddings
+
+
+def enroll_reference_photos(store, analyzer, directory=REFERENCE_DIR):
+    """
+    Keep an EmbeddingStore in step with the faces/<profile>/<image>
+    reference photos. Each photo is enrolled once, under a source key of
+    its path and mtime: new photos are picked up on the next start, and
+    the embeddings of replaced or deleted photos are removed.
+    """
+    if not os.path.isdir(directory):
+        return
+    enrolled = store.sources()
+    seen = set()
+    for name in sorted(os.listdir(directory)):
+        profile_dir = os.path.join(directory, name)
+        if not os.path.isdir(profile_dir):
+            continue
+        for filename in sorted(os.listdir(profile_dir)):
+            path = os.path.join(profile_dir, filename)
+            source = f'{name}/{filename}:{os.stat(path).st_mtime_ns}'
+            seen.add(source)
+            if source in enrolled:
+                continue
+            image = cv2.imread(path)
+            if image is None:
+                continue
+            _count, embeddings = analyzer.analyze(image)
+            if embeddings:
+                store.enroll(name, embeddings[0], source=source)
+            else:
+                print(f"No face found in reference photo {name}/{filename}")
+    for source in enrolled - seen:
+        store.remove_source(source)
+    print(f"{store.count} reference face(s) enrolled for {len(store.profiles())} profile(s).")
+
+
+class RecognitionPipeline:
+    """
+    capture -> [frames] -> detect + embed (worker pool) -> [results] -> decide
+
+    Both queues are DropOldestQueues of a few items, so when the workers
+    fall behind they skip to the newest frame instead of lagging. The
+    decision stage reports a profile through update_callback only after
+    confirm_frames consecutive results agree, and falls back to guest
+    when nobody recognised has been seen for absent_timeout seconds.
+    """
+
+    def __init__(self, update_callback, source, analyzer, matcher, workers=1,
+                 frame_skip=2, max_width=320, realtime=True, loop=False,
+                 confirm_frames=3, absent_timeout=10):
+        self.update_callback = update_callback
+        self.analyzer = analyzer
+        self.matcher = matcher
+        self.workers = workers
+        self.confirm_frames = confirm_frames
+        self.absent_timeout = absent_timeout
+        self.frames = DropOldestQueue(maxsize=2)
+        self.results = DropOldestQueue(maxsize=4)
+        self.capture = FrameSource(source, self.frames, frame_skip, max_width, realtime, loop)
+        self.realtime = realtime
+        self.profile = None
+        self.frames_analyzed = 0
+        self._threads = []
+        self._stopped = threading.Event()
+        self._active_workers = workers
+        self._workers_lock = threading.Lock()
+
+    def start(self):
+        # One OpenCV thread per worker keeps CPU use predictable next to the UI.
+        cv2.setNumThreads(1)
+        self.capture.start()
+        for _ in range(self.workers):
+            self._spawn(self._analyze_loop)
+        self._spawn(self._decide_loop)
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self.capture.stop()
+        self.frames.close()
+        self.results.close()
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _spawn(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _analyze_loop(self):
+        while not self._stopped.is_set():
+            item = self.frames.get(timeout=1)
+            if item is None:
+                if self.frames.closed:
+                    break
+                continue
+            timestamp, frame = item
+            try:
+                count, embeddings = self.analyzer.analyze(frame)
+            except Exception as e:
+                print(f"Face analysis failed: {e}")
+                continue
+            with self._workers_lock:
+                self.frames_analyzed += 1
+            name = None
+            # Every face of the frame in one pass over the enrolled profiles.
+            for candidate, _score in self.matcher.match_many(embeddings):
+                if candidate:
+                    name = candidate
+                    break
+            self.results.put((timestamp, count, name), block=not self.realtime)
+        # The last worker out ends the decision stage.
+        with self._workers_lock:
+            self._active_workers -= 1
+            if self._active_workers == 0:
+                self.results.close()
+
+    def _decide_loop(self):
+        latest = None
+        candidate, streak = None, 0
+        last_seen = None
+        while not self._stopped.is_set():
+            item = self.results.get(timeout=1)
+            if item is None:
+                if self.results.closed:
+                    break
+                continue
+            timestamp, _count, name = item
+            # Workers may finish out of order; older results are stale.
+            if latest is not None and timestamp < latest:
+                continue
+            latest = timestamp
+            if name:
+                last_seen = timestamp
+                streak = streak + 1 if name == candidate else 1
+                candidate = name
+                if streak >= self.confirm_frames:
+                    self._report(name)
+            elif last_seen is None or timestamp - last_seen >= self.absent_timeout:
+                candidate, streak = None, 0
+                self._report(GUEST)
+
+    def _report(self, profile):
+        if profile != self.profile:
+            self.profile = profile
+            self.update_callback(profile)
+
+
+def build_pipeline(update_callback, source, **options):
+    """
+    A RecognitionPipeline configured from the FACE_* environment variables,
+    matching against the enrolled profiles' EmbeddingStore.
+    """
+    from profiles.embedding_store import EmbeddingStore, DEFAULT_THRESHOLD
+
+    analyzer = FaceAnalyzer(os.getenv("FACE_DETECTOR_MODEL"), os.getenv("FACE_RECOGNIZER_MODEL"))
+    if not analyzer.can_identify:
+        print("FACE_DETECTOR_MODEL/FACE_RECOGNIZER_MODEL not set; faces are detected but not identified.")
+    matcher = EmbeddingStore(default_threshold=float(os.getenv("FACE_MATCH_THRESHOLD", DEFAULT_THRESHOLD)))
+    if analyzer.can_identify:
+        enroll_reference_photos(matcher, analyzer, os.getenv("FACE_REFERENCE_DIR", REFERENCE_DIR))
+    options.setdefault('workers', int(os.getenv("FACE_WORKERS", 1)))
+    options.setdefault('frame_skip', int(os.getenv("FACE_FRAME_SKIP", 2)))
+    options.setdefault('max_width', int(os.getenv("FACE_MAX_WIDTH", 320)))
+    return RecognitionPipeline(update_callback, source, analyzer, matcher, **options)
+
+
+def recognize_file(path, **options):
+    """
+    Run the pipeline over a recorded video as fast as possible and return
+    the profile switches it reported, in order, for testing without a camera.
+    """
+    switches = []
+    options.setdefault('realtime', False)
+    # Several workers finish out of order and the decision stage skips
+    # results older than one it has seen; one worker keeps runs repeatable.
+    options.setdefault('workers', 1)
+    pipeline = build_pipeline(switches.append, path, **options).start()
+    pipeline.capture.join()
+    pipeline.join(timeout=30)
+    return switches
+
+
 def start_recognition(update_callback):
+    """
+    Start recognizing who is in front of the mirror in the background and
+    call update_callback(profile_name) from a worker thread on changes.
+
+    FACE_SOURCE selects a camera index (e.g. 0) or a video file; without it,
+    or without OpenCV installed, the simulated loop alternates profiles.
+    """
+    source = os.getenv("FACE_SOURCE")
+    if source and cv2 is not None:
+        return build_pipeline(update_callback, source, loop=not source.isdigit()).start()
+    if source:
+        print("OpenCV is not installed; using simulated face recognition.")
     thread = threading.Thread(target=recognition_loop, args=(update_callback,), daemon=True)
     thread.start()
@@ -1,6 +1,8 @@
 from kivy.uix.boxlayout import BoxLayout
 from kivy.properties import StringProperty, NumericProperty, ObjectProperty
 from kivy.core.window import Window
+from kivy.clock import Clock
+from widgets.profiler import profiled
 
 class WidgetCard(BoxLayout):
     title = StringProperty("Widget")
@@ -13,6 +15,8 @@ class WidgetCard(BoxLayout):
     _resizing = False
     _resizing_corner_size = 30
     overlay = None
+    layout_manager = None  # DashboardLayout, once registered with one
+    suspended = False  # while its dashboard is off screen, see suspend()
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -21,14 +25,75 @@ class WidgetCard(BoxLayout):
         self._dragging = False
         self._drag_offset_x = 0
         self._drag_offset_y = 0
-
-    def update_size(self, instance, width, height):
+        # Dirty flags, flushed by at most one render pass per frame.
+        self._data_dirty = False
+        self._layout_dirty = False
+        self._render_trigger = Clock.create_trigger(self._render_pass, -1)
+        self.bind(size=self._on_geometry)
+
+    def invalidate(self, data=False):
+        """
+        Schedule a render pass before the next frame. data=True also
+        recomputes the content (refresh_data); otherwise only the cheap,
+        geometry-only relayout runs. Any number of calls within one frame
+        coalesce into a single pass.
+        """
+        if data:
+            self._data_dirty = True
+        self._layout_dirty = True
+        if not self.suspended:
+            self._render_trigger()
+
+    def suspend(self):
+        """
+        Stop rendering while the card is off screen. It keeps receiving
+        data; invalidations are only recorded and flushed by resume().
+        """
+        self.suspended = True
+        self._render_trigger.cancel()
+
+    def resume(self):
+        self.suspended = False
+        if self._data_dirty or self._layout_dirty:
+            self._render_trigger()
+
+    def release(self):
+        """Disconnect from the window and data sources before the card is dropped."""
+        self.suspend()
+        Window.unbind(on_resize=self.update_size)
+
+    def refresh_data(self):
+        """Recompute what the card shows. Subclasses override."""
+
+    def relayout(self):
+        """Fit the computed content to the current size. Subclasses override."""
+
+    def _on_geometry(self, *args):
+        self.invalidate()
+
+    @profiled(per_class=True)
+    def _render_pass(self, dt):
+        data_dirty, layout_dirty = self._data_dirty, self._layout_dirty
+        self._data_dirty = self._layout_dirty = False
+        if data_dirty:
+            self.refresh_data()
+        if layout_dirty:
+            self.relayout()
+
+    def cell_size(self):
+        # A DashboardLayout caches it once per window resize.
+        if self.layout_manager is not None:
+            return self.layout_manager.cell_w, self.layout_manager.cell_h
         cols, rows = self.grid_size
+        return max(Window.width / cols, 1), max(Window.height / rows, 1)
 
-        total_width = width
-        total_height = height
-        cell_w = max(total_width / cols, 1)
-        cell_h = max(total_height / rows, 1)
+    def update_size(self, instance, width, height):
+        if self.layout_manager is not None:
+            cell_w, cell_h = self.layout_manager.cell_w, self.layout_manager.cell_h
+        else:
+            cols, rows = self.grid_size
+            cell_w = max(width / cols, 1)
+            cell_h = max(height / rows, 1)
 
         self.widget_width = min(cell_w * self.grid_width, width) - 2 * self.widget_padding
         self.widget_height = min(cell_h * self.grid_height, height) - 2 * self.widget_padding
@@ -50,18 +115,16 @@ class WidgetCard(BoxLayout):
 
     def on_touch_move(self, touch):
         if self._resizing:
-            cols, rows = self.grid_size
-
-            total_width = Window.width
-            total_height = Window.height
-            cell_w = max(total_width / cols, 1)
-            cell_h = max(total_height / rows, 1)
-
-            new_w = (touch.x - self.x) / cell_w
-            new_h = (self.height + self.y - touch.y) / cell_h
-            self.grid_width = max(1, round(new_w))
-            self.grid_height = max(1, round(new_h))
-            self.update_size(Window, Window.width, Window.height)
+            cell_w, cell_h = self.cell_size()
+
+            new_w = max(1, round((touch.x - self.x) / cell_w))
+            new_h = max(1, round((self.height + self.y - touch.y) / cell_h))
+            # Most touch events stay within the same grid cell; only a new
+            # cell count changes the size (and invalidates the layout).
+            if (new_w, new_h) != (self.grid_width, self.grid_height):
+                self.grid_width = new_w
+                self.grid_height = new_h
+                self.update_size(Window, Window.width, Window.height)
             return True
         elif self._dragging:
             self.x = touch.x - self._drag_offset_x
@@ -74,7 +137,12 @@ class WidgetCard(BoxLayout):
         self._resizing = False
         self._dragging = False
 
-        if was_resizing or was_dragging:
+        if (was_resizing or was_dragging) and self.layout_manager is not None:
+            # Snaps to the nearest spot not taken by another card.
+            self.layout_manager.snap(self)
+            if self.overlay:
+                self.overlay.opacity = 0
+        elif was_resizing or was_dragging:
             cols, rows = self.grid_size
 
             total_width = Window.width
@@ -0,0 +1,440 @@
+# File: src/widgets/caldav_sync.py
+"""
+Incremental CalDAV synchronisation.
+
+A CalendarSync keeps a local href -> object map in step with one calendar
+collection. Each sync first asks for the collection ctag and sync-token
+(one depth-0 PROPFIND), which is enough to detect "nothing changed". When
+something did change it uses an RFC 6578 sync-collection REPORT, or an
+ETag listing on servers without sync-token support, and downloads only the
+added or changed hrefs with a calendar-multiget REPORT.
+
+query_time_range() is the other fetch path: a calendar-query REPORT that
+only returns events overlapping a time range, optionally expanded into
+single instances by the server.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from xml.sax.saxutils import escape, quoteattr
+from widgets.profiler import profiled
+
+DAV_NS = 'DAV:'
+CALDAV_NS = 'urn:ietf:params:xml:ns:caldav'
+CS_NS = 'http://calendarserver.org/ns/'
+
+APPLE_NS = 'http://apple.com/ns/ical/'
+
+GETETAG = f'{{{DAV_NS}}}getetag'
+DISPLAYNAME = f'{{{DAV_NS}}}displayname'
+RESOURCETYPE = f'{{{DAV_NS}}}resourcetype'
+CALDAV_CALENDAR = f'{{{CALDAV_NS}}}calendar'
+CALENDAR_COLOR = f'{{{APPLE_NS}}}calendar-color'
+SYNC_TOKEN = f'{{{DAV_NS}}}sync-token'
+GETCTAG = f'{{{CS_NS}}}getctag'
+CALENDAR_DATA = f'{{{CALDAV_NS}}}calendar-data'
+
+MULTIGET_BATCH_SIZE = 100
+HTTP_POOL_SIZE = 4
+
+CTAG_PROPFIND = """<?xml version="1.0" encoding="utf-8"?>
+<D:propfind xmlns:D="DAV:" xmlns:CS="http://calendarserver.org/ns/">
+  <D:prop><CS:getctag/><D:sync-token/></D:prop>
+</D:propfind>"""
+
+CALENDARS_PROPFIND = """<?xml version="1.0" encoding="utf-8"?>
+<D:propfind xmlns:D="DAV:" xmlns:A="http://apple.com/ns/ical/">
+  <D:prop><D:displayname/><D:resourcetype/><A:calendar-color/></D:prop>
+</D:propfind>"""
+
+ETAG_PROPFIND = """<?xml version="1.0" encoding="utf-8"?>
+<D:propfind xmlns:D="DAV:">
+  <D:prop><D:getetag/><D:resourcetype/></D:prop>
+</D:propfind>"""
+
+SYNC_COLLECTION_REPORT = """<?xml version="1.0" encoding="utf-8"?>
+<D:sync-collection xmlns:D="DAV:">
+  <D:sync-token>{token}</D:sync-token>
+  <D:sync-level>1</D:sync-level>
+  <D:prop><D:getetag/></D:prop>
+</D:sync-collection>"""
+
+MULTIGET_REPORT = """<?xml version="1.0" encoding="utf-8"?>
+<C:calendar-multiget xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+  <D:prop><D:getetag/><C:calendar-data/></D:prop>
+{hrefs}
+</C:calendar-multiget>"""
+
+TIME_RANGE_REPORT = """<?xml version="1.0" encoding="utf-8"?>
+<C:calendar-query xmlns:D="DAV:" xmlns:C="urn:ietf:params:xml:ns:caldav">
+  <D:prop><D:getetag/>{calendar_data}</D:prop>
+  <C:filter>
+    <C:comp-filter name="VCALENDAR">
+      <C:comp-filter name="VEVENT">
+        <C:time-range start={start} end={end}/>
+      </C:comp-filter>
+    </C:comp-filter>
+  </C:filter>
+</C:calendar-query>"""
+
+EXPANDED_CALENDAR_DATA = '<C:calendar-data><C:expand start={start} end={end}/></C:calendar-data>'
+
+
+class SyncError(Exception):
+    """Raised when the server rejects a sync request."""
+
+
+class RemoteObject:
+    """
+    One calendar object resource as last seen on the server.
+    Exposes `data` like caldav's Event so get_parsed_event can read it.
+    """
+    __slots__ = ('href', 'etag', 'data')
+
+    def __init__(self, href, etag, data):
+        self.href = href
+        self.etag = etag
+        self.data = data
+
+    def __repr__(self):
+        return f"RemoteObject({self.href!r}, etag={self.etag!r})"
+
+
+class SyncDiff:
+    """Hrefs added, changed and removed by one sync pass."""
+
+    def __init__(self, added=None, changed=None, removed=None):
+        self.added = added or []
+        self.changed = changed or []
+        self.removed = removed or []
+
+    @property
+    def unchanged(self):
+        return not (self.added or self.changed or self.removed)
+
+    def __repr__(self):
+        return (f"SyncDiff(added={len(self.added)}, changed={len(self.changed)}, "
+                f"removed={len(self.removed)})")
+
+
+def _check(response):
+    if response.status >= 400:
+        raise SyncError(f"CalDAV server answered {response.status}")
+    return response
+
+
+def parse_multistatus(response):
+    """
+    Yield (href, status, props) for every <D:response> of a multistatus
+    body. props maps the Clark-notation tag of every property returned
+    with a 2xx propstat to its text; status is the response-level status
+    line, which sync-collection uses to report deleted hrefs.
+    """
+    tree = getattr(response, 'tree', None)
+    if tree is None:
+        return
+    for node in tree.iter(f'{{{DAV_NS}}}response'):
+        href = node.findtext(f'{{{DAV_NS}}}href')
+        status = node.findtext(f'{{{DAV_NS}}}status')
+        props = {}
+        for propstat in node.findall(f'{{{DAV_NS}}}propstat'):
+            propstat_status = propstat.findtext(f'{{{DAV_NS}}}status') or ''
+            if ' 2' not in propstat_status:
+                continue
+            prop = propstat.find(f'{{{DAV_NS}}}prop')
+            if prop is None:
+                continue
+            for child in prop:
+                props[child.tag] = child.text if len(child) == 0 else child
+        yield href, status, props
+
+
+class CalendarSync:
+    """
+    Keeps `objects` (href -> RemoteObject) in step with one calendar.
+    The map is patched in place on every sync, never rebuilt.
+    """
+
+    def __init__(self, calendar):
+        self.calendar = calendar
+        self.client = calendar.client
+        self.url = str(calendar.url)
+        self.objects = {}
+        self.ctag = None
+        self.sync_token = None
+        self.supports_sync_token = True
+
+    def restore(self, objects, ctag, sync_token):
+        """Seed the local state, e.g. from EventCache, before the first sync."""
+        self.objects.update(objects)
+        self.ctag = ctag
+        self.sync_token = sync_token
+
+    def collection_state(self):
+        """Return (ctag, sync_token) with one depth-0 PROPFIND."""
+        response = _check(self.client.propfind(self.url, CTAG_PROPFIND, depth=0))
+        for _href, _status, props in parse_multistatus(response):
+            return props.get(GETCTAG), props.get(SYNC_TOKEN)
+        return None, None
+
+    def sync(self):
+        """
+        Bring `objects` up to date and return a SyncDiff describing what
+        changed. An unchanged ctag or sync-token costs a single request.
+        """
+        try:
+            ctag, token = self.collection_state()
+        except Exception as e:
+            print(f"Failed to read collection state, doing a full listing: {e}")
+            ctag, token = None, None
+
+        if self.objects or self.ctag or self.sync_token:
+            if ctag is not None and ctag == self.ctag:
+                return SyncDiff()
+            if token is not None and token == self.sync_token:
+                return SyncDiff()
+
+        remote_etags = None
+        removed = []
+        if self.supports_sync_token:
+            try:
+                remote_etags, removed, new_token = self._sync_collection(self.sync_token or '')
+                token = new_token or token
+                if not self.sync_token:
+                    # Without a token the server lists every member instead
+                    # of reporting deletions, as after a restore without a
+                    # token or an ETag fallback.
+                    removed = [href for href in self.objects if href not in remote_etags]
+            except SyncError as e:
+                if self.sync_token:
+                    print(f"Sync-token rejected, falling back to an ETag listing: {e}")
+                else:
+                    print(f"Server does not support sync-collection: {e}")
+                    self.supports_sync_token = False
+                remote_etags = None
+
+        if remote_etags is None:
+            # Full ETag listing; anything not listed has been deleted.
+            remote_etags = self._list_etags()
+            removed = [href for href in self.objects if href not in remote_etags]
+            token = None
+
+        diff = self._apply(remote_etags, removed)
+        self.ctag = ctag
+        self.sync_token = token
+        return diff
+
+    def _sync_collection(self, token):
+        body = SYNC_COLLECTION_REPORT.format(token=escape(token))
+        try:
+            response = self.client.report(self.url, body, depth=1)
+        except Exception as e:
+            # caldav raises its own errors for some statuses, e.g. the 403
+            # a server answers an expired sync-token with (RFC 6578 3.2).
+            raise SyncError(f"sync-collection failed: {e}") from e
+        response = _check(response)
+        etags = {}
+        removed = []
+        for href, status, props in parse_multistatus(response):
+            if not href or href.rstrip('/') == self._path():
+                continue
+            if status and ' 404' in status:
+                if href in self.objects:
+                    removed.append(href)
+                continue
+            etag = props.get(GETETAG)
+            if etag is not None:
+                etags[href] = etag
+        new_token = None
+        tree = getattr(response, 'tree', None)
+        if tree is not None:
+            new_token = tree.findtext(SYNC_TOKEN)
+        return etags, removed, new_token
+
+    def _list_etags(self):
+        response = _check(self.client.propfind(self.url, ETAG_PROPFIND, depth=1))
+        etags = {}
+        for href, _status, props in parse_multistatus(response):
+            if not href or href.rstrip('/') == self._path():
+                continue
+            etag = props.get(GETETAG)
+            if etag is not None:
+                etags[href] = etag
+        return etags
+
+    def _path(self):
+        # Hrefs in responses are usually absolute paths, not full URLs.
+        path = getattr(self.calendar.url, 'path', None) or self.url
+        return path.rstrip('/')
+
+    def _apply(self, remote_etags, removed):
+        stale = [href for href, etag in remote_etags.items()
+                 if href not in self.objects or self.objects[href].etag != etag]
+        diff = SyncDiff()
+        for obj in self.multiget(stale):
+            if obj.href in self.objects:
+                diff.changed.append(obj.href)
+            else:
+                diff.added.append(obj.href)
+            self.objects[obj.href] = obj
+        for href in removed:
+            if self.objects.pop(href, None) is not None:
+                diff.removed.append(href)
+        return diff
+
+    def multiget(self, hrefs):
+        """Download the bodies of hrefs in calendar-multiget batches."""
+        return multiget(self.calendar, hrefs)
+
+
+def discover_calendars(principal):
+    """
+    Return [(calendar, display_name, color)] for every calendar in the
+    principal's calendar home set, using one depth-1 PROPFIND instead of
+    one request per calendar. color is the server's hex string or None.
+    """
+    from caldav import Calendar
+
+    home = principal.calendar_home_set
+    response = _check(principal.client.propfind(str(home.url), CALENDARS_PROPFIND, depth=1))
+    calendars = []
+    for href, _status, props in parse_multistatus(response):
+        resourcetype = props.get(RESOURCETYPE)
+        if resourcetype is None or isinstance(resourcetype, str):
+            continue
+        if resourcetype.find(CALDAV_CALENDAR) is None:
+            continue
+        display_name = (props.get(DISPLAYNAME) or '').strip() or None
+        calendar = Calendar(client=principal.client, url=home.url.join(href), parent=home, name=display_name)
+        calendars.append((calendar, display_name, props.get(CALENDAR_COLOR)))
+    return calendars
+
+
+@profiled('fetch.multiget')
+def multiget(calendar, hrefs):
+    """
+    Return RemoteObjects for hrefs of calendar, fetched in batches of
+    MULTIGET_BATCH_SIZE with calendar-multiget REPORTs.
+    """
+    objects = []
+    for i in range(0, len(hrefs), MULTIGET_BATCH_SIZE):
+        batch = hrefs[i:i + MULTIGET_BATCH_SIZE]
+        body = MULTIGET_REPORT.format(
+            hrefs='\n'.join(f'  <D:href>{escape(href)}</D:href>' for href in batch)
+        )
+        response = _check(calendar.client.report(str(calendar.url), body, depth=1))
+        for href, _status, props in parse_multistatus(response):
+            data = props.get(CALENDAR_DATA)
+            if href and data:
+                objects.append(RemoteObject(href, props.get(GETETAG), data))
+    return objects
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def http_session():
+    """Return the shared keep-alive requests.Session used for plain GETs."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def fetch_urls(urls, auth=None, max_workers=HTTP_POOL_SIZE):
+    """
+    GET urls through the shared session, at most max_workers at a time.
+    Returns {url: body bytes}; failures are logged and left out.
+    """
+    session = http_session()
+
+    def fetch(url):
+        response = session.get(url, auth=auth, timeout=30)
+        response.raise_for_status()
+        return response.content
+
+    bodies = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {url: pool.submit(fetch, url) for url in urls}
+        for url, future in futures.items():
+            try:
+                bodies[url] = future.result()
+            except Exception as e:
+                print(f"Failed to fetch event body from {url}: {e}")
+    return bodies
+
+
+def load_event_bodies(events, calendar=None, auth=None):
+    """
+    Give every event whose `instance` is a URL but which has no `data` its
+    body. URLs on the calendar's own server are fetched in bulk with
+    calendar-multiget; the rest, and anything multiget missed, with pooled
+    GETs. auth is only sent to the calendar's own host.
+    """
+    pending = {}
+    for event in events:
+        instance = getattr(event, 'instance', None)
+        if not getattr(event, 'data', None) and isinstance(instance, str):
+            pending.setdefault(instance, []).append(event)
+    if not pending:
+        return
+
+    calendar_host = urlsplit(str(calendar.url)).netloc if calendar is not None else None
+    if calendar is not None:
+        by_path = {urlsplit(url).path: url for url in pending if urlsplit(url).netloc == calendar_host}
+        if by_path:
+            try:
+                for obj in multiget(calendar, list(by_path)):
+                    url = by_path.get(obj.href)
+                    for event in pending.pop(url, []):
+                        event.data = obj.data
+            except Exception as e:
+                print(f"calendar-multiget failed, fetching bodies one by one: {e}")
+
+    own = [url for url in pending if urlsplit(url).netloc == calendar_host]
+    other = [url for url in pending if urlsplit(url).netloc != calendar_host]
+    bodies = fetch_urls(own, auth=auth) if own else {}
+    if other:
+        bodies.update(fetch_urls(other))
+    for url, body in bodies.items():
+        for event in pending[url]:
+            event.data = body
+
+
+def _caldav_time(value):
+    # Naive UTC datetime -> CalDAV UTC timestamp.
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+
+def query_time_range(calendar, start, end, expand=False):
+    """
+    Return RemoteObjects for the events of calendar overlapping
+    [start, end] (naive UTC) with one calendar-query REPORT.
+
+    With expand=True the server is asked to expand recurring events into
+    single instances within the range. Servers that ignore the request
+    return the master events unchanged, which build_event_records still
+    expands on the client. Raises SyncError if the query is rejected.
+    """
+    start_attr = quoteattr(_caldav_time(start))
+    end_attr = quoteattr(_caldav_time(end))
+    if expand:
+        calendar_data = EXPANDED_CALENDAR_DATA.format(start=start_attr, end=end_attr)
+    else:
+        calendar_data = '<C:calendar-data/>'
+    body = TIME_RANGE_REPORT.format(calendar_data=calendar_data, start=start_attr, end=end_attr)
+    response = _check(calendar.client.report(str(calendar.url), body, depth=1))
+    objects = []
+    for href, _status, props in parse_multistatus(response):
+        data = props.get(CALENDAR_DATA)
+        if href and data:
+            objects.append(RemoteObject(href, props.get(GETETAG), data))
+    return objects
@@ -1,15 +1,17 @@
 # File: src/widgets/calendar_common.py
 import os
+import re
+import bisect
+import heapq
+import calendar
+import threading
+from itertools import islice, takewhile
 import icalendar
-import requests
-from datetime import datetime, date, time, timezone
-from dateutil.rrule import rrulestr
+from collections import namedtuple
+from datetime import datetime, date, time, timezone, timedelta
+from dateutil.rrule import rrulestr, rruleset
 from dateutil import tz
-
-try:
-    from caldav.elements import dav
-except ImportError:
-    dav = None
+from widgets.profiler import profiled
 
 def to_naive_utc(dt):
     """
@@ -30,18 +32,415 @@ def to_local_display(dt):
         dt = dt.replace(tzinfo=timezone.utc)
     return dt.astimezone(tz.tzlocal())
 
-def get_parsed_event(event):
+def _as_naive_utc(value):
+    # Date-only values become midnight, like DTSTART handling elsewhere.
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime.combine(value, time.min)
+    return to_naive_utc(value)
+
+def _date_list(prop):
+    """Flatten an EXDATE/RDATE property (one or many lines) to naive UTC datetimes."""
+    if prop is None:
+        return []
+    props = prop if isinstance(prop, list) else [prop]
+    values = []
+    for p in props:
+        for item in getattr(p, 'dts', []):
+            value = item.dt
+            if isinstance(value, tuple):
+                # RDATE;VALUE=PERIOD: keep the period start.
+                value = value[0]
+            values.append(_as_naive_utc(value))
+    return values
+
+# Rule frequencies whose periods all have the same length. dateutil expands
+# a rule from DTSTART on, so these are re-anchored to a DTSTART close to
+# the span asked for (see EventRecord.anchor); months and years vary in
+# length and are sparse enough to expand from the start.
+FIXED_PERIODS = {
+    'WEEKLY': timedelta(weeks=1),
+    'DAILY': timedelta(days=1),
+    'HOURLY': timedelta(hours=1),
+    'MINUTELY': timedelta(minutes=1),
+    'SECONDLY': timedelta(seconds=1),
+}
+
+class EventRecord:
     """
-    Return a parsed VEVENT component from an event.
+    Normalized, pre-parsed form of one VEVENT.
+    All datetimes are naive UTC. The recurrence set is compiled once and
+    reused by every render; records are built once per event version
+    (href + ETag) and shared by all calendar widgets. `source` tags the
+    calendar the record came from when several calendars are merged.
+    """
+    __slots__ = ('href', 'etag', 'uid', 'summary', 'location', 'start', 'duration',
+                 'all_day', 'rrule', 'exdates', 'rdates', 'source', '_ruleset', '_rule', '_step')
+
+    def __init__(self, href, etag, uid, summary, location, start, duration,
+                 all_day=False, rrule=None, exdates=(), rdates=(), source=None):
+        self.href = href
+        self.etag = etag
+        self.uid = uid
+        self.summary = summary
+        self.location = location
+        self.start = start
+        self.duration = duration
+        self.all_day = all_day
+        self.rrule = rrule
+        self.exdates = tuple(exdates)
+        self.rdates = tuple(rdates)
+        self.source = source
+        self._ruleset = None
+        self._rule = None
+        self._step = None
+
+    @property
+    def key(self):
+        """Identity that stays unique across calendars, (source, href)."""
+        return (self.source or '', self.href)
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+    @property
+    def recurring(self):
+        return bool(self.rrule or self.rdates)
+
+    def _compile_rule(self):
+        self._rule = rrulestr(self.rrule, dtstart=self.start)
+        # Repeat period of the rule (INTERVAL periods), if it is fixed
+        # and the rule has no COUNT, which counts from the real DTSTART.
+        parts = dict(part.split('=', 1) for part in self.rrule.upper().split(';') if '=' in part)
+        period = FIXED_PERIODS.get(parts.get('FREQ'))
+        if period is not None and 'COUNT' not in parts:
+            self._step = period * int(parts.get('INTERVAL', 1))
+
+    def anchor(self, start):
+        """
+        DTSTART to expand from to get every occurrence at or after start:
+        the real one, or for a fixed-period rule the real one moved ahead
+        by whole repeat periods. The anchor's own period ends before
+        start, so no occurrence from start on is lost, and expanding costs
+        a couple of periods instead of everything since DTSTART.
+        """
+        if not self.rrule:
+            return self.start
+        if self._rule is None:
+            self._compile_rule()
+        if self._step is None or start <= self.start:
+            return self.start
+        steps = (start - self.start) // self._step - 1
+        if steps < 1:
+            return self.start
+        return self.start + steps * self._step
+
+    def ruleset(self, start=None):
+        """
+        Return a dateutil rruleset for the occurrences at or after start
+        (all of them without start). The full set is compiled once;
+        re-anchored ones share the parsed rule.
+        """
+        anchor = self.anchor(start) if start is not None else self.start
+        if anchor == self.start and self._ruleset is not None:
+            return self._ruleset
+        rset = rruleset()
+        if self.rrule:
+            if self._rule is None:
+                self._compile_rule()
+            rset.rrule(self._rule if anchor == self.start else self._rule.replace(dtstart=anchor))
+        # DTSTART is always an occurrence, even if the rule would skip it.
+        rset.rdate(self.start)
+        for value in self.rdates:
+            rset.rdate(value)
+        for value in self.exdates:
+            rset.exdate(value)
+        if anchor == self.start:
+            self._ruleset = rset
+        return rset
+
+    def occurrences_between(self, start, end):
+        """Return the naive UTC occurrence starts within [start, end]."""
+        if not self.recurring:
+            if start <= self.start <= end and self.start not in self.exdates:
+                return [self.start]
+            return []
+        return self.ruleset(start).between(start, end, inc=True)
+
+    def to_dict(self):
+        """Plain JSON-friendly form, used by EventCache."""
+        return {
+            'href': self.href,
+            'etag': self.etag,
+            'uid': self.uid,
+            'summary': self.summary,
+            'location': self.location,
+            'start': self.start.isoformat(),
+            'duration': self.duration.total_seconds(),
+            'all_day': self.all_day,
+            'rrule': self.rrule,
+            'exdates': [value.isoformat() for value in self.exdates],
+            'rdates': [value.isoformat() for value in self.rdates],
+            'source': self.source,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['href'], data['etag'], data['uid'], data['summary'], data['location'],
+            datetime.fromisoformat(data['start']),
+            timedelta(seconds=data['duration']),
+            all_day=data['all_day'],
+            rrule=data['rrule'],
+            exdates=[datetime.fromisoformat(value) for value in data['exdates']],
+            rdates=[datetime.fromisoformat(value) for value in data['rdates']],
+            source=data.get('source'),
+        )
+
+    def __repr__(self):
+        return f"EventRecord({self.summary!r}, start={self.start!r}, href={self.href!r})"
+
+def _record_from_component(parsed, href, etag, overridden=(), source=None):
+    # Returns None if the VEVENT has no DTSTART.
+    dtstart_prop = parsed.get('dtstart')
+    if not dtstart_prop:
+        return None
+    dtstart = dtstart_prop.dt
+    all_day = isinstance(dtstart, date) and not isinstance(dtstart, datetime)
+    start = _as_naive_utc(dtstart)
+
+    # Determine event duration.
+    if parsed.get('dtend'):
+        duration = _as_naive_utc(parsed.get('dtend').dt) - start
+    elif parsed.get('duration'):
+        duration = parsed.get('duration').dt
+    else:
+        duration = timedelta(hours=1)
+
+    rrule = None
+    rrule_prop = parsed.get('rrule')
+    if rrule_prop:
+        rrule = rrule_prop.to_ical().decode('utf-8')
+        # DTSTART is expanded as naive UTC, so UNTIL must be naive too.
+        rrule = re.sub(r'(UNTIL=\d{8}T\d{6})Z', r'\1', rrule)
+
+    return EventRecord(
+        href, etag,
+        str(parsed.get('uid', '')),
+        str(parsed.get('summary', 'Unnamed')),
+        str(parsed.get('location', 'No Location')),
+        start, duration,
+        all_day=all_day,
+        rrule=rrule,
+        exdates=_date_list(parsed.get('exdate')) + list(overridden),
+        rdates=_date_list(parsed.get('rdate')),
+        source=source,
+    )
+
+@profiled('parse.build_event_records')
+def build_event_records(event, href=None, etag=None, source=None):
+    """
+    Parse every VEVENT of one calendar object resource into EventRecords.
+    Instances overridden with a RECURRENCE-ID become records of their own,
+    keyed "<href>#<recurrence-id>", and are excluded from the master
+    series. Server-expanded responses, where every instance carries a
+    RECURRENCE-ID, therefore yield one non-recurring record per instance.
+    """
+    if href is None:
+        href = getattr(event, 'href', None) or str(getattr(event, 'url', '') or '')
+    if etag is None:
+        etag = getattr(event, 'etag', None)
+
+    masters = []
+    overrides = []
+    for component in get_parsed_events(event):
+        if component.get('recurrence-id'):
+            overrides.append((_as_naive_utc(component.get('recurrence-id').dt), component))
+        else:
+            masters.append(component)
+    overridden = [recurrence_id for recurrence_id, _component in overrides]
+
+    records = []
+    for component in masters:
+        record = _record_from_component(component, href, etag, overridden, source)
+        if record is not None:
+            records.append(record)
+    for recurrence_id, component in overrides:
+        record = _record_from_component(component, f"{href}#{recurrence_id.isoformat()}", etag, source=source)
+        if record is not None:
+            records.append(record)
+    return records
+
+Occurrence = namedtuple('Occurrence', 'start end record')
+
+def iter_occurrences(record, start):
+    """Lazily yield (start, end, key) for record's occurrences at or after start."""
+    if not record.recurring:
+        if record.start >= start and record.start not in record.exdates:
+            yield (record.start, record.end, record.key)
+        return
+    for occ in record.ruleset(start).xafter(start, inc=True):
+        yield (occ, occ + record.duration, record.key)
+
+def upcoming_occurrences(records, start, count, until=None):
+    """
+    Return the first count Occurrences at or after start, optionally only
+    those starting by until. One lazy iterator per series is merged through
+    a heap, so the merge takes about count occurrences in total. Each
+    series is expanded from its anchor (see EventRecord.anchor): weekly
+    and finer rules without COUNT start within a couple of periods of
+    start, while monthly, yearly and COUNT rules still expand from DTSTART.
+    """
+    by_key = {record.key: record for record in records}
+    merged = heapq.merge(*(iter_occurrences(record, start) for record in by_key.values()))
+    if until is not None:
+        merged = takewhile(lambda entry: entry[0] <= until, merged)
+    return [Occurrence(s, e, by_key[key]) for s, e, key in islice(merged, count)]
+
+class OccurrenceIndex:
+    """
+    Expanded occurrences of a set of EventRecords over a rolling window.
+
+    Occurrences are kept in one list of (start, end, key) tuples sorted by
+    start, so a month or "next N" query is a bisect plus a slice instead of
+    a re-expansion. The window only ever grows at its edges (ensure) or
+    slides forward (roll); each edge expands just the new span. When the
+    record set changes only the series whose record object changed are
+    dropped and re-expanded. Safe to use from the repository worker and
+    the UI thread at the same time.
+    """
+
+    def __init__(self, lookbehind=timedelta(days=45), lookahead=timedelta(days=200)):
+        self.lookbehind = lookbehind
+        self.lookahead = lookahead
+        self.records = {}  # record.key -> EventRecord
+        self.start = None  # window is [start, end)
+        self.end = None
+        self._entries = []
+        self._lock = threading.RLock()
+
+    def update(self, records):
+        """
+        Replace the record set. Records are built once per event version,
+        so a series is re-expanded only if its record object is new.
+        """
+        new_records = {record.key: record for record in records}
+        with self._lock:
+            stale = {key for key, record in self.records.items()
+                     if new_records.get(key) is not record}
+            fresh = [record for key, record in new_records.items()
+                     if self.records.get(key) is not record]
+            self.records = new_records
+            if self.start is None:
+                return
+            if stale:
+                self._entries = [entry for entry in self._entries if entry[2] not in stale]
+            added = []
+            for record in fresh:
+                added.extend(self._expand(record, self.start, self.end))
+            self._insert(added)
+
+    def ensure(self, start, end):
+        """Make sure [start, end) is expanded, growing the window at its edges."""
+        with self._lock:
+            if self.start is None:
+                self.start, self.end = start, start
+            added = []
+            if start < self.start:
+                for record in self.records.values():
+                    added.extend(self._expand(record, start, self.start))
+                self.start = start
+            if end > self.end:
+                for record in self.records.values():
+                    added.extend(self._expand(record, self.end, end))
+                self.end = end
+            self._insert(added)
+
+    def roll(self, now=None):
+        """
+        Slide the window to [now - lookbehind, now + lookahead): expand the
+        new days ahead and forget occurrences that have fallen behind.
+        """
+        if now is None:
+            now = to_naive_utc(datetime.now(timezone.utc))
+        start = now - self.lookbehind
+        with self._lock:
+            self.ensure(start, now + self.lookahead)
+            if start > self.start:
+                cut = bisect.bisect_left(self._entries, (start,))
+                del self._entries[:cut]
+                self.start = start
+
+    def between(self, start, end):
+        """Return Occurrences starting within [start, end], sorted by start."""
+        with self._lock:
+            self.ensure(start, end + timedelta(microseconds=1))
+            lo = bisect.bisect_left(self._entries, (start,))
+            hi = bisect.bisect_right(self._entries, (end, datetime.max))
+            entries = self._entries[lo:hi]
+            records = self.records
+        return [Occurrence(s, e, records[key]) for s, e, key in entries if key in records]
+
+    def next_after(self, start, count, horizon=None):
+        """
+        Return the first count Occurrences starting at or after start, and
+        within horizon if one is given. Served from the window; if the
+        window runs out first the rest comes from a lazy merge past its end.
+        """
+        until = start + horizon if horizon is not None else None
+        with self._lock:
+            if self.start is None or start < self.start or start > self.end:
+                self.ensure(start, start)
+            lo = bisect.bisect_left(self._entries, (start,))
+            entries = self._entries[lo:lo + count]
+            window_end = self.end
+            records = self.records
+        result = [Occurrence(s, e, records[key]) for s, e, key in entries
+                  if key in records and (until is None or s <= until)]
+        if len(result) < count and (until is None or until >= window_end):
+            result.extend(upcoming_occurrences(records.values(), window_end, count - len(result), until))
+        return result
+
+    def by_local_date(self, year, month):
+        """Return {local date: [Occurrence, ...]} for one month in local time."""
+        last_day = calendar.monthrange(year, month)[1]
+        month_start_utc = to_naive_utc(datetime(year, month, 1, 0, 0, 0).astimezone())
+        month_end_utc = to_naive_utc(datetime(year, month, last_day, 23, 59, 59).astimezone())
+        occurrences_by_date = {}
+        for occ in self.between(month_start_utc, month_end_utc):
+            occ_local = to_local_display(occ.start)
+            if occ_local.year == year and occ_local.month == month:
+                occurrences_by_date.setdefault(occ_local.date(), []).append(occ)
+        return occurrences_by_date
+
+    def _expand(self, record, start, end):
+        # Half-open [start, end) so adjacent spans never duplicate an occurrence.
+        try:
+            starts = record.occurrences_between(start, end)
+        except Exception as e:
+            print(f"Failed to expand {record!r}: {e}")
+            return []
+        return [(occ, occ + record.duration, record.key) for occ in starts if occ < end]
+
+    def _insert(self, entries):
+        if entries:
+            self._entries.extend(entries)
+            # Timsort merges the already sorted run with the new one cheaply.
+            self._entries.sort()
+
+@profiled('parse.get_parsed_events')
+def get_parsed_events(event):
+    """
+    Return every parsed VEVENT component of an event.
     First try event.data, then event.instance if needed.
     """
     data = getattr(event, 'data', None)
     if data:
         try:
             cal = icalendar.Calendar.from_ical(data)
-            for component in cal.walk():
-                if component.name == "VEVENT":
-                    return component
+            components = [c for c in cal.walk() if c.name == "VEVENT"]
+            if components:
+                return components
             raise ValueError("No VEVENT component found in event.data")
         except Exception as e:
             print(f"Error parsing event.data: {e}")
@@ -51,54 +450,72 @@ def get_parsed_event(event):
         raise ValueError("Event does not have data or instance information.")
     
     if isinstance(instance, str):
-        response = requests.get(instance)
-        response.raise_for_status()
-        cal = icalendar.Calendar.from_ical(response.content)
-        for component in cal.walk():
-            if component.name == "VEVENT":
-                return component
-        raise ValueError("No VEVENT component found in ICS from instance URL")
-    elif hasattr(instance, 'get'):
-        return instance
-    else:
-        return instance
+        # Parsing never touches the network; bodies are fetched in bulk by
+        # caldav_sync.load_event_bodies on a worker thread beforehand.
+        raise ValueError(f"Event body at {instance} has not been fetched.")
+    return [instance]
 
-def connect_to_calendar(calendar_url, username, app_password, target_calendar_name=None):
+@profiled('parse.get_parsed_event')
+def get_parsed_event(event):
     """
-    Connect to CalDAV using the provided credentials.
-    Returns a tuple (calendars, selected_calendar) where:
-      - calendars is the list of calendars available.
-      - selected_calendar is the matching calendar (or the default first one).
+    Return the first parsed VEVENT component from an event.
+    """
+    return get_parsed_events(event)[0]
+
+@profiled('fetch.list_calendars')
+def list_calendars(calendar_url, username, app_password):
+    """
+    Connect to CalDAV and return [(calendar, display_name, color)] for
+    every calendar of the account. Display names come from a single
+    depth-1 PROPFIND; servers that reject it are asked per calendar.
     """
     from caldav import DAVClient
+    from caldav.elements import dav
+    from widgets.caldav_sync import discover_calendars
 
     client = DAVClient(url=calendar_url, username=username, password=app_password)
     principal = client.principal()
-    calendars = principal.calendars()
-    print(f"Connected to CalDAV. Found {len(calendars)} calendar(s).")
-    
-    if not calendars:
-        print("No calendars were found for this account.")
-        return calendars, None
-
-    default_cal = calendars[0]
-    if target_calendar_name:
-        found = False
-        for cal in calendars:
+    try:
+        calendars = discover_calendars(principal)
+    except Exception as e:
+        print(f"Failed to list calendars in one request, asking each calendar: {e}")
+        calendars = []
+        for cal in principal.calendars():
+            display_name = None
             try:
                 props = cal.get_properties([dav.DisplayName()])
                 display_name = props.get('{DAV:}displayname')
-                if display_name and display_name.strip() == target_calendar_name.strip():
-                    default_cal = cal
-                    found = True
-                    break
             except Exception as e:
                 print(f"Failed to get calendar display name: {e}")
-        if not found:
-            print(f"Calendar with name '{target_calendar_name}' not found. Using default calendar.")
-        else:
-            print(f"Using calendar named '{target_calendar_name}'.")
+            calendars.append((cal, display_name.strip() if display_name else None, None))
+    print(f"Connected to CalDAV. Found {len(calendars)} calendar(s).")
+    return calendars
+
+def select_calendar(calendars, target_calendar_name=None):
+    """
+    Pick the (calendar, display_name, color) entry named target_calendar_name
+    from list_calendars' result, or the first calendar. None if there are none.
+    """
+    if not calendars:
+        print("No calendars were found for this account.")
+        return None
+    if target_calendar_name:
+        for entry in calendars:
+            if entry[1] and entry[1] == target_calendar_name.strip():
+                print(f"Using calendar named '{target_calendar_name}'.")
+                return entry
+        print(f"Calendar with name '{target_calendar_name}' not found. Using default calendar.")
     else:
         print("No CALENDAR_NAME provided. Using default calendar.")
-    
-    return calendars, default_cal
\ No newline at end of file
+    return calendars[0]
+
+def connect_to_calendar(calendar_url, username, app_password, target_calendar_name=None):
+    """
+    Connect to CalDAV using the provided credentials.
+    Returns a tuple (calendars, selected_calendar) where:
+      - calendars is the list of calendars available.
+      - selected_calendar is the matching calendar (or the default first one).
+    """
+    calendars = list_calendars(calendar_url, username, app_password)
+    selected = select_calendar(calendars, target_calendar_name)
+    return [entry[0] for entry in calendars], selected[0] if selected else None
@@ -1,41 +1,78 @@
-import os
 import calendar
-import requests
-import icalendar
-from datetime import datetime, date, time, timezone, timedelta
-from dateutil.rrule import rrulestr
-from dateutil import tz
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from kivy.clock import Clock
+from kivy.core.window import Window
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.gridlayout import GridLayout
-from kivy.uix.label import Label
-from kivy.uix.scrollview import ScrollView
-from dotenv import load_dotenv
+from kivy.graphics import Color, Line
 from widgets.base_widget import WidgetCard
-from widgets.calendar_common import to_naive_utc, to_local_display, get_parsed_event, connect_to_calendar
+from widgets.calendar_common import to_naive_utc
+from widgets.event_repository import get_event_repository, DEFAULT_CALENDAR_URL
+from widgets.profiler import profiled
+from widgets.texture_cache import CachedLabel
 
 
-# Load the .env file from the project root
-project_root = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
-load_dotenv(dotenv_path=project_root)
+# A month spans at most six weeks.
+MAX_WEEKS = 6
+
+# Occurrence maps kept per widget: the shown month, its neighbours and a
+# few recently visited ones.
+MONTH_CACHE_SIZE = 6
+
+# One worker prefetches adjacent months for every calendar widget.
+_prefetch_pool = ThreadPoolExecutor(max_workers=1)
+
+# Arrow keys for month navigation.
+KEY_LEFT = 276
+KEY_RIGHT = 275
+
+
+def shift_month(month, year, delta):
+    """(month, year) delta months away."""
+    index = year * 12 + (month - 1) + delta
+    return index % 12 + 1, index // 12
+
+
+class DayCell(BoxLayout):
+    """
+    One day of the month grid. Cells are created once and re-labelled on
+    every render; event labels are lent to them from CalendarWidget's pool.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(orientation='vertical', spacing=2, **kwargs)
+        # Add a border around the cell.
+        with self.canvas.before:
+            Color(0, 0, 0, 1)  # Black border
+            self.border = Line(rectangle=(self.x, self.y, self.width, self.height), width=1)
+        self.bind(pos=self._update_border, size=self._update_border)
+
+        # A container for the day number with fixed height.
+        self.date_container = BoxLayout(size_hint_y=None)
+        # Day numbers 1-31 come from the shared texture cache.
+        self.day_number = CachedLabel(halign='center', valign='middle')
+        self.date_container.add_widget(self.day_number)
+        self.add_widget(self.date_container)
+
+        # An event container that takes the remaining space.
+        self.event_container = BoxLayout(orientation='vertical', size_hint_y=1)
+        self.add_widget(self.event_container)
+        self.event_labels = []
+
+    def _update_border(self, *args):
+        self.border.rectangle = (self.x, self.y, self.width, self.height)
 
-try:
-    import caldav
-    from caldav.elements import dav
-except ImportError:
-    caldav = None
 
 class CalendarWidget(WidgetCard):
     def __init__(self, **kwargs):
-        self.username = os.getenv("CALDAV_USERNAME")
-        self.app_password = os.getenv("CALDAV_APP_PASSWORD")
-        self.calendar_url = kwargs.pop('calendar_url', 'https://caldav.icloud.com/')
-        self.target_calendar_name = os.getenv("CALENDAR_NAME")
+        self.calendar_url = kwargs.pop('calendar_url', DEFAULT_CALENDAR_URL)
         
         super().__init__(**kwargs)
         
         self.title = "Calendar"
-        self.calendars = []
-        self.events = []  # Raw events from the calendar
+        self.events = []  # EventRecords from the shared repository
         
         now = datetime.now()
         self.current_year = now.year
@@ -48,103 +85,183 @@ class CalendarWidget(WidgetCard):
         min_calendar_height = 300
         self.calendar_view.height = max(self.height, min_calendar_height)
         self.add_widget(self.calendar_view)
+        self.build_grid()
+        self.occ_by_date = {}
+        # (year, month) -> occurrence map, most recently used last. Bumping
+        # the generation invalidates maps still being computed.
+        self.month_cache = OrderedDict()
+        self.generation = 0
+        self._prefetching = set()
+        Window.bind(on_key_down=self.on_key_down)
 
-        # Re-render when size changes.
-        self.bind(size=self.on_size)
-
-        self.calendars, default_cal = connect_to_calendar(self.calendar_url, self.username, self.app_password, self.target_calendar_name)
-        if default_cal:
-            self.events = default_cal.events()
-            print(f"Fetched {len(self.events)} event(s) from the selected calendar.")
+        # Render the empty month on the first frame; events arrive from the
+        # shared repository's worker thread once they have been fetched.
+        # Size changes only relayout, see WidgetCard.invalidate.
+        self.repository = get_event_repository(self.calendar_url)
         self.render_month(self.current_month, self.current_year)
+        self.repository.subscribe(self.on_events)
+
+    def on_events(self, events, diff=None):
+        # Called on the main thread whenever the repository has new events.
+        self.events = events
+        self.generation += 1
+        self.month_cache.clear()
+        self.invalidate(data=True)
+
+    def next_month(self):
+        self.render_month(*shift_month(self.current_month, self.current_year, 1))
 
-    def on_size(self, *args):
-        # Re-render the month when the widget's size changes.
-        if not hasattr(self, 'current_month') or not hasattr(self, 'current_year'):
+    def previous_month(self):
+        self.render_month(*shift_month(self.current_month, self.current_year, -1))
+
+    def release(self):
+        super().release()
+        Window.unbind(on_key_down=self.on_key_down)
+        self.repository.unsubscribe(self.on_events)
+
+    def on_key_down(self, window, key, *args):
+        if self.suspended:
             return
-        self.render_month(self.current_month, self.current_year)
+        if key == KEY_RIGHT:
+            self.next_month()
+        elif key == KEY_LEFT:
+            self.previous_month()
 
+    @profiled(per_class=True)
     def compute_occurrences_for_month(self, month, year):
         """
-        Compute occurrences for all events in the current month.
-        Returns a dictionary mapping local date objects to lists of occurrence dicts.
-        Each occurrence dict has keys:
-          'dtstart' (naive UTC datetime),
-          'dtend' (naive UTC datetime),
-          'summary',
-          'location'
+        Return a dictionary mapping local date objects to lists of
+        Occurrence(start, end, record) tuples for the given month.
+        Times are naive UTC. This is a lookup in the repository's shared
+        occurrence index; only days not yet in its window are expanded.
         """
-        occurrences_by_date = {}
-        from calendar import monthrange
-        last_day = monthrange(year, month)[1]
-        # Compute local month boundaries.
-        month_start_local = datetime(year, month, 1, 0, 0, 0)
-        month_end_local = datetime(year, month, last_day, 23, 59, 59)
-        # Convert local boundaries to naive UTC for recurrence expansion.
-        month_start_utc = to_naive_utc(month_start_local)
-        month_end_utc = to_naive_utc(month_end_local)
-
-        for event in self.events:
+        # In range fetch mode, make sure this month has been fetched.
+        last_day = calendar.monthrange(year, month)[1]
+        month_start_utc = to_naive_utc(datetime(year, month, 1, 0, 0, 0).astimezone())
+        month_end_utc = to_naive_utc(datetime(year, month, last_day, 23, 59, 59).astimezone())
+        self.repository.request_range(month_start_utc, month_end_utc)
+        return self.repository.occurrences.by_local_date(year, month)
+
+    def build_grid(self):
+        """
+        Build the header and the 6x7 day cells once. render_month only
+        updates their text, opacity and geometry afterwards.
+        """
+        # Header row for day abbreviations.
+        self.header_layout = GridLayout(cols=7, spacing=5, size_hint_y=None)
+        for day in calendar.day_abbr:
+            self.header_layout.add_widget(CachedLabel(text=day, bold=True))
+        self.calendar_view.add_widget(self.header_layout)
+
+        # Weekly rows.
+        self.week_rows = []
+        self.day_cells = []
+        for _ in range(MAX_WEEKS):
+            week_layout = GridLayout(cols=7, spacing=5, size_hint_y=None)
+            for _ in range(7):
+                cell = DayCell()
+                week_layout.add_widget(cell)
+                self.day_cells.append(cell)
+            self.calendar_view.add_widget(week_layout)
+            self.week_rows.append(week_layout)
+
+        # Event labels not currently shown in any cell.
+        self.free_event_labels = []
+
+    def take_event_label(self):
+        if self.free_event_labels:
+            return self.free_event_labels.pop()
+        # Repeated summaries ("Standup") share one cached texture.
+        return CachedLabel(
+            font_size=10,
+            size_hint=(None, None),
+            height=15,
+            shorten=True,
+            halign='left',
+            valign='middle'
+        )
+
+    def fill_cell(self, cell, day, month, day_events, header_height, label_width):
+        # day is None for the cells of a collapsed spare row.
+        cell.day_number.text = str(day.day) if day else ''
+        cell.day_number.opacity = 1 if day and day.month == month else 0.5
+        cell.date_container.height = header_height * 0.5
+
+        # Return surplus labels to the pool, then borrow what is missing.
+        while len(cell.event_labels) > len(day_events):
+            event_label = cell.event_labels.pop()
+            cell.event_container.remove_widget(event_label)
+            self.free_event_labels.append(event_label)
+        while len(cell.event_labels) < len(day_events):
+            event_label = self.take_event_label()
+            cell.event_container.add_widget(event_label)
+            cell.event_labels.append(event_label)
+
+        for event_label, ev in zip(cell.event_labels, day_events):
             try:
-                parsed = get_parsed_event(event)
-                dtstart_prop = parsed.get('dtstart')
-                if not dtstart_prop:
-                    continue
-                dtstart = dtstart_prop.dt
-                if isinstance(dtstart, date) and not isinstance(dtstart, datetime):
-                    dtstart = datetime.combine(dtstart, time.min)
-                dtstart_utc = to_naive_utc(dtstart)
-                # Determine event duration.
-                if parsed.get('dtend'):
-                    dtend = parsed.get('dtend').dt
-                    if isinstance(dtend, date) and not isinstance(dtend, datetime):
-                        dtend = datetime.combine(dtend, time.min)
-                    duration = dtend - dtstart
-                else:
-                    duration = timedelta(hours=1)
-                rrule_prop = parsed.get('rrule')
-                if rrule_prop:
-                    # Expand recurring events over the month window.
-                    rule_str = rrule_prop.to_ical().decode('utf-8')
-                    rule = rrulestr(rule_str, dtstart=dtstart_utc)
-                    occs = rule.between(month_start_utc, month_end_utc, inc=True)
-                    # Also include the original dtstart if it falls within the window.
-                    if dtstart_utc >= month_start_utc and dtstart_utc <= month_end_utc and dtstart_utc not in occs:
-                        occs.insert(0, dtstart_utc)
-                    for occ in occs:
-                        # Convert occurrence to local time to check if it falls in the target month.
-                        occ_local = to_local_display(occ)
-                        if occ_local.year == year and occ_local.month == month:
-                            occ_date = occ_local.date()
-                            occ_event = {
-                                'dtstart': occ,
-                                'dtend': occ + duration,
-                                'summary': parsed.get('summary', 'Unnamed'),
-                                'location': parsed.get('location', 'No Location')
-                            }
-                            occurrences_by_date.setdefault(occ_date, []).append(occ_event)
-                else:
-                    # Non-recurring event.
-                    dtstart_local = to_local_display(dtstart_utc)
-                    if dtstart_local.year == year and dtstart_local.month == month:
-                        occ_date = dtstart_local.date()
-                        event_dict = {
-                            'dtstart': dtstart_utc,
-                            'dtend': dtstart_utc + duration,
-                            'summary': parsed.get('summary', 'Unnamed'),
-                            'location': parsed.get('location', 'No Location')
-                        }
-                        occurrences_by_date.setdefault(occ_date, []).append(event_dict)
-            except Exception as e:
-                print(f"Failed to process event for recurrence expansion: {e}")
-                continue
-        return occurrences_by_date
+                label_text = f"{ev.record.summary}"
+            except Exception as ex:
+                label_text = "Unnamed"
+            event_label.text = label_text
+            event_label.color = self.repository.color_for(ev.record)
+            event_label.width = label_width  # fixed width per day cell
 
     def render_month(self, month, year):
-        self.calendar_view.clear_widgets()
-        # Compute occurrences for the month.
-        occ_by_date = self.compute_occurrences_for_month(month, year)
-        
+        """Show the given month; the grid is filled on the next frame."""
+        self.current_month = month
+        self.current_year = year
+        self.invalidate(data=True)
+
+    @profiled(per_class=True)
+    def refresh_data(self):
+        # Usually prefetched; otherwise compute the month now.
+        key = (self.current_year, self.current_month)
+        occ_by_date = self.month_cache.get(key)
+        if occ_by_date is None:
+            occ_by_date = self.compute_occurrences_for_month(self.current_month, self.current_year)
+            self.store_month(key, occ_by_date)
+        else:
+            self.month_cache.move_to_end(key)
+        self.occ_by_date = occ_by_date
+        self.prefetch_adjacent()
+
+    def store_month(self, key, occ_by_date):
+        self.month_cache[key] = occ_by_date
+        self.month_cache.move_to_end(key)
+        while len(self.month_cache) > MONTH_CACHE_SIZE:
+            self.month_cache.popitem(last=False)
+
+    def prefetch_adjacent(self):
+        """Compute the previous and next month on the worker thread."""
+        for delta in (1, -1):
+            month, year = shift_month(self.current_month, self.current_year, delta)
+            key = (year, month)
+            if key in self.month_cache or key in self._prefetching:
+                continue
+            self._prefetching.add(key)
+            future = _prefetch_pool.submit(self.compute_occurrences_for_month, month, year)
+            future.add_done_callback(
+                lambda future, key=key, generation=self.generation: Clock.schedule_once(
+                    lambda dt: self._prefetched(key, generation, future))
+            )
+
+    def _prefetched(self, key, generation, future):
+        self._prefetching.discard(key)
+        try:
+            occ_by_date = future.result()
+        except Exception as e:
+            print(f"Failed to prefetch {key[1]}/{key[0]}: {e}")
+            return
+        # Events changed while it was computed; it will be redone on demand.
+        if generation != self.generation:
+            return
+        self.store_month(key, occ_by_date)
+
+    @profiled(per_class=True)
+    def relayout(self):
+        month, year = self.current_month, self.current_year
+        occ_by_date = self.occ_by_date
+
         # Calculate dynamic heights.
         header_height = max(30, self.height * 0.1)
         cal = calendar.Calendar(firstweekday=0)
@@ -153,64 +270,19 @@ class CalendarWidget(WidgetCard):
         total_spacing = self.calendar_view.spacing * (num_weeks + 1)
         available_height = max(self.height - header_height - total_spacing, 0)
         week_height = max(30, available_height / num_weeks)
+        label_width = self.width / 7 - 10
 
-        # Header row for day abbreviations.
-        header_layout = GridLayout(cols=7, spacing=5, size_hint_y=None, height=header_height)
-        for day in calendar.day_abbr:
-            header = Label(text=day, bold=True)
-            header_layout.add_widget(header)
-        self.calendar_view.add_widget(header_layout)
-
-        # Weekly rows.
-        for week in month_days:
-            week_layout = GridLayout(cols=7, spacing=5, size_hint_y=None, height=week_height)
-            for day in week:
-                day_box = BoxLayout(orientation='vertical', spacing=2)
-                # Add a border around the day_box.
-                with day_box.canvas.before:
-                    from kivy.graphics import Color, Line
-                    Color(0, 0, 0, 1) # Black border
-                    day_box.border = Line(rectangle=(day_box.x, day_box.y, day_box.width, day_box.height), width=1)
-                def update_rect(instance, value):
-                    instance.border.rectangle = (instance.x, instance.y, instance.width, instance.height)
-                day_box.bind(pos=update_rect, size=update_rect)
-
-                # Create a container for the day number with fixed height.
-                date_container = BoxLayout(size_hint_y=None, height=header_height * 0.5)
-                day_number = Label(text=str(day.day), halign='center', valign='middle')
-                # Force the label to render its text centered.
-                day_number.bind(size=day_number.setter('text_size'))
-                if day.month != month:
-                    day_number.opacity = 0.5
-                date_container.add_widget(day_number)
-                day_box.add_widget(date_container)
-
-                # Create an event container that takes the remaining space.
-                event_container = BoxLayout(orientation='vertical', size_hint_y=1)
-                # Add event labels for this day.
-                day_events = occ_by_date.get(day, [])
-                for ev in day_events:
-                    try:
-                        local_start = to_local_display(ev['dtstart'])
-                        event_summary = ev['summary']
-                        label_text = f"{event_summary}"
-                    except Exception as ex:
-                        label_text = "Unnamed"
-                    event_label = Label(
-                        markup=True,
-                        text=label_text,
-                        font_size=10,
-                        size_hint=(None, None),
-                        width=self.width / 7 - 10,  # fixed width per day cell
-                        height=15,
-                        shorten=True,
-                        shorten_from='right',
-                        color=(1, 0, 0, 1),
-                        text_size=(self.width / 7 - 10, 15),
-                        halign='left',
-                        valign='middle'
-                    )
-                    event_container.add_widget(event_label)
-                day_box.add_widget(event_container)
-                week_layout.add_widget(day_box)
-            self.calendar_view.add_widget(week_layout)
+        self.header_layout.height = header_height
+        for row, week_layout in enumerate(self.week_rows):
+            if row >= num_weeks:
+                # Months with fewer weeks collapse the spare rows.
+                week_layout.height = 0
+                week_layout.opacity = 0
+                for cell in self.day_cells[row * 7:(row + 1) * 7]:
+                    self.fill_cell(cell, None, month, [], header_height, label_width)
+                continue
+            week_layout.height = week_height
+            week_layout.opacity = 1
+            for col, day in enumerate(month_days[row]):
+                cell = self.day_cells[row * 7 + col]
+                self.fill_cell(cell, day, month, occ_by_date.get(day, []), header_height, label_width)
@@ -0,0 +1,172 @@
+from kivy.clock import Clock
+from kivy.core.window import Window
+
+
+class DashboardLayout:
+    """
+    Places WidgetCards on a grid of cols x rows cells covering the window.
+
+    Cell geometry is computed once per window resize, and one layout pass
+    per frame sizes and positions every registered card, so there is one
+    resize handler however many cards the dashboard has. An occupancy map
+    (a count of cards per cell, row-major from the bottom-left) answers
+    "is this footprint free?" by looking at the w x h cells it covers,
+    however many cards there are. Cards dropped onto an occupied spot snap
+    to the nearest free one, trying spots in order of distance; on the
+    12 x 12 grid that is at most 144 footprint checks per drop.
+
+    A card registered when no spot is free overlaps others; the counts
+    keep the shared cells occupied until every card on them has left.
+
+    on_change(layout), if set, is called whenever a card is placed, e.g.
+    to persist the layout after the user moves a card.
+    """
+
+    def __init__(self, grid_size=(12, 12), padding=10):
+        self.grid_size = tuple(grid_size)
+        self.padding = padding
+        self.cards = []
+        self._placements = {}  # card -> (col, row, width, height) in cells
+        self._occupancy = bytearray(self.grid_size[0] * self.grid_size[1])
+        self.on_change = None
+        self._layout_trigger = Clock.create_trigger(self._apply, -1)
+        self.update_geometry(Window, Window.width, Window.height)
+        Window.bind(on_resize=self.update_geometry)
+
+    def update_geometry(self, instance, width, height):
+        cols, rows = self.grid_size
+        self.width = width
+        self.height = height
+        self.cell_w = max(width / cols, 1)
+        self.cell_h = max(height / rows, 1)
+        self._layout_trigger()
+
+    def register(self, card, col=None, row=None):
+        """
+        Manage card, placing it at (col, row) or the nearest free spot.
+        Without a position the first free spot from the top left is used.
+        """
+        # The card no longer needs its own resize handler.
+        Window.unbind(on_resize=card.update_size)
+        card.grid_size = self.grid_size
+        card.layout_manager = self
+        self.cards.append(card)
+        w, h = self._clamp_span(card.grid_width, card.grid_height)
+        if col is None or row is None:
+            slot = self.first_free(w, h)
+        else:
+            slot = self.nearest_free(col, row, w, h)
+        if slot is None:
+            print(f"No free space for {card.title}; overlapping other cards.")
+            slot = (0, max(self.grid_size[1] - h, 0))
+        self._place(card, slot[0], slot[1], w, h)
+
+    def release(self):
+        """Stop following the window before the layout is dropped."""
+        Window.unbind(on_resize=self.update_geometry)
+        self._layout_trigger.cancel()
+
+    def unregister(self, card):
+        if card in self._placements:
+            self._mark(self._placements.pop(card), -1)
+        if card in self.cards:
+            self.cards.remove(card)
+        card.layout_manager = None
+        Window.bind(on_resize=card.update_size)
+
+    def placement(self, card):
+        """(col, row, width, height) of a managed card, in cells."""
+        return self._placements.get(card)
+
+    def cell_at(self, x, y):
+        """Grid cell nearest to the window position (x, y)."""
+        return round(x / self.cell_w), round(y / self.cell_h)
+
+    def is_free(self, col, row, w, h, ignore=None):
+        cols, rows = self.grid_size
+        if col < 0 or row < 0 or col + w > cols or row + h > rows:
+            return False
+        if ignore in self._placements:
+            own_col, own_row, own_w, own_h = self._placements[ignore]
+        else:
+            own_col = own_row = own_w = own_h = 0
+        occupancy = self._occupancy
+        for r in range(row, row + h):
+            base = r * cols
+            for c in range(col, col + w):
+                own = own_col <= c < own_col + own_w and own_row <= r < own_row + own_h
+                if occupancy[base + c] > own:
+                    return False
+        return True
+
+    def first_free(self, w, h, ignore=None):
+        cols, rows = self.grid_size
+        for row in range(rows - h, -1, -1):
+            for col in range(cols - w + 1):
+                if self.is_free(col, row, w, h, ignore):
+                    return col, row
+        return None
+
+    def nearest_free(self, col, row, w, h, ignore=None):
+        """Closest (col, row) to the requested one where a w x h card fits."""
+        cols, rows = self.grid_size
+        col = min(max(col, 0), max(cols - w, 0))
+        row = min(max(row, 0), max(rows - h, 0))
+        candidates = sorted(
+            ((c - col) ** 2 + (r - row) ** 2, c, r)
+            for r in range(rows - h + 1)
+            for c in range(cols - w + 1)
+        )
+        for _distance, c, r in candidates:
+            if self.is_free(c, r, w, h, ignore):
+                return c, r
+        return None
+
+    def snap(self, card):
+        """
+        Drop a card that was dragged or resized: keep its new size if it
+        fits anywhere, otherwise its old one, at the nearest free spot.
+        """
+        old = self._placements.get(card)
+        col, row = self.cell_at(card.x, card.y)
+        for w, h in [self._clamp_span(card.grid_width, card.grid_height)] + ([old[2:]] if old else []):
+            slot = self.nearest_free(col, row, w, h, ignore=card)
+            if slot is not None:
+                self._place(card, slot[0], slot[1], w, h)
+                return
+        self._layout_trigger()
+
+    def _clamp_span(self, w, h):
+        cols, rows = self.grid_size
+        return min(max(int(w), 1), cols), min(max(int(h), 1), rows)
+
+    def _place(self, card, col, row, w, h):
+        if card in self._placements:
+            self._mark(self._placements[card], -1)
+        self._placements[card] = (col, row, w, h)
+        self._mark((col, row, w, h), 1)
+        card.grid_width = w
+        card.grid_height = h
+        self._layout_trigger()
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def _mark(self, placement, delta):
+        # Add delta (1 or -1) to the card count of every covered cell.
+        col, row, w, h = placement
+        cols = self.grid_size[0]
+        occupancy = self._occupancy
+        for r in range(row, row + h):
+            base = r * cols
+            for c in range(base + col, base + col + w):
+                occupancy[c] += delta
+
+    def _apply(self, dt):
+        # One pass for all cards after any number of changes in a frame.
+        padding = self.padding
+        for card in self.cards:
+            col, row, w, h = self._placements[card]
+            card.widget_width = self.cell_w * w - 2 * padding
+            card.widget_height = self.cell_h * h - 2 * padding
+            card.x = col * self.cell_w + padding
+            card.y = row * self.cell_h + padding
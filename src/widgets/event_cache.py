@@ -0,0 +1,172 @@
+# File: src/widgets/event_cache.py
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from widgets.caldav_sync import RemoteObject
+from widgets.calendar_common import EventRecord
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache')
+CACHE_PATH = os.path.join(CACHE_DIR, 'events.sqlite3')
+
+# Bump when the row layout changes; older cache files are then discarded.
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    source TEXT NOT NULL,
+    href TEXT NOT NULL,
+    etag TEXT,
+    records TEXT,
+    recurring INTEGER NOT NULL,
+    end_utc TEXT,
+    PRIMARY KEY (source, href)
+);
+CREATE INDEX IF NOT EXISTS events_expiry ON events (source, recurring, end_utc);
+CREATE TABLE IF NOT EXISTS collections (
+    source TEXT PRIMARY KEY,
+    ctag TEXT,
+    sync_token TEXT
+);
+CREATE TABLE IF NOT EXISTS evicted (
+    source TEXT NOT NULL,
+    href TEXT NOT NULL,
+    etag TEXT,
+    PRIMARY KEY (source, href)
+);
+"""
+
+
+class EventCache:
+    """
+    On-disk store of parsed EventRecords keyed by (source, href) with
+    their ETag, so widgets can render from disk at startup without
+    parsing any iCalendar, and the next sync only has to transfer what
+    changed since the last run. Each row holds the resource's records as
+    a JSON list of EventRecord.to_dict() fields, not the raw ICS, so
+    loading is EventRecord.from_dict() and nothing else. Objects that
+    failed to parse are kept with no records so they are not downloaded
+    again until their ETag changes.
+
+    Non-recurring events that ended more than max_age_days ago are evicted,
+    and the oldest of them go first once a source holds more than
+    max_events objects. Recurring series are never evicted.
+
+    The stored ctag and sync-token still describe the whole collection,
+    so every evicted href keeps its ETag in the evicted table. load()
+    hands those to CalendarSync as known objects without records: an
+    ETag listing then skips them like any other unchanged object, and
+    an evicted event is only downloaded again, and shown, once it is
+    edited on the server.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_events=5000, max_age_days=365):
+        self.path = path
+        self.max_events = max_events
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # The repository worker thread and the main thread may both use it.
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        (version,) = self._conn.execute("PRAGMA user_version").fetchone()
+        if version != SCHEMA_VERSION:
+            self._conn.executescript(
+                "DROP TABLE IF EXISTS events; DROP TABLE IF EXISTS collections;"
+                " DROP TABLE IF EXISTS evicted;"
+            )
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._conn.executescript(SCHEMA)
+
+    def load(self, source):
+        """
+        Return (objects, records, ctag, sync_token) stored for source.
+        objects maps href -> RemoteObject (ETag only, no body) for seeding
+        CalendarSync, evicted hrefs included; records maps href ->
+        [EventRecord, ...].
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT href, etag, records FROM events WHERE source = ?", (source,)
+            ).fetchall()
+            evicted = self._conn.execute(
+                "SELECT href, etag FROM evicted WHERE source = ?", (source,)
+            ).fetchall()
+            state = self._conn.execute(
+                "SELECT ctag, sync_token FROM collections WHERE source = ?", (source,)
+            ).fetchone()
+        objects = {href: RemoteObject(href, etag, None) for href, etag in evicted}
+        records = {}
+        for href, etag, stored in rows:
+            objects[href] = RemoteObject(href, etag, None)
+            records[href] = [EventRecord.from_dict(data) for data in json.loads(stored)]
+        ctag, sync_token = state if state else (None, None)
+        return objects, records, ctag, sync_token
+
+    def store(self, source, objects, records, diff, ctag, sync_token):
+        """
+        Write the hrefs named in diff, then evict. records maps each
+        resource href to its EventRecords.
+        """
+        rows = []
+        for href in diff.added + diff.changed:
+            obj = objects.get(href)
+            if obj is None:
+                continue
+            resource_records = records.get(href, [])
+            recurring = not resource_records or any(r.recurring for r in resource_records)
+            end_utc = None if recurring else max(r.end for r in resource_records).isoformat()
+            rows.append((source, href, obj.etag,
+                         json.dumps([r.to_dict() for r in resource_records]),
+                         int(recurring), end_utc))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO events (source, href, etag, records, recurring, end_utc) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.executemany(
+                "DELETE FROM events WHERE source = ? AND href = ?",
+                [(source, href) for href in diff.removed]
+            )
+            self._conn.executemany(
+                "DELETE FROM evicted WHERE source = ? AND href = ?",
+                [(source, href) for href in diff.added + diff.changed + diff.removed]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO collections (source, ctag, sync_token) VALUES (?, ?, ?)",
+                (source, ctag, sync_token)
+            )
+            self._evict(source)
+
+    def _evict(self, source):
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=self.max_age_days)
+        self._move_to_evicted(
+            "SELECT rowid FROM events WHERE source = ? AND recurring = 0 AND end_utc < ?",
+            (source, cutoff.isoformat())
+        )
+        (count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM events WHERE source = ?", (source,)
+        ).fetchone()
+        excess = count - self.max_events
+        if excess > 0:
+            self._move_to_evicted(
+                "SELECT rowid FROM events WHERE source = ? AND recurring = 0"
+                " ORDER BY end_utc, rowid LIMIT ?",
+                (source, excess)
+            )
+
+    def _move_to_evicted(self, select_rowids, params):
+        # Keep the href and ETag, drop the records.
+        self._conn.execute(
+            "INSERT OR REPLACE INTO evicted (source, href, etag)"
+            f" SELECT source, href, etag FROM events WHERE rowid IN ({select_rowids})",
+            params
+        )
+        self._conn.execute(f"DELETE FROM events WHERE rowid IN ({select_rowids})", params)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
@@ -0,0 +1,580 @@
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from kivy.clock import Clock
+from widgets.calendar_common import list_calendars, select_calendar, build_event_records, OccurrenceIndex, to_naive_utc
+from widgets.caldav_sync import CalendarSync, SyncError, query_time_range, load_event_bodies
+from widgets.event_cache import EventCache
+from widgets.profiler import profiled
+from widgets.refresh_scheduler import RefreshScheduler
+
+DEFAULT_CALENDAR_URL = 'https://caldav.icloud.com/'
+
+# How the repository fetches events, see EventRepository.
+FETCH_MODES = ('sync', 'full', 'range')
+
+# Optional list of calendars to merge, see load_calendar_sources.
+SOURCES_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'calendars.json')
+
+# Colors for calendars that have none configured or on the server.
+DEFAULT_COLORS = [
+    (1, 0, 0, 1),
+    (0.2, 0.5, 1, 1),
+    (0.2, 0.75, 0.3, 1),
+    (1, 0.6, 0, 1),
+    (0.65, 0.35, 0.9, 1),
+    (0, 0.75, 0.75, 1),
+    (1, 0.4, 0.7, 1),
+    (0.6, 0.6, 0.6, 1),
+]
+
+MAX_FETCH_WORKERS = 8
+
+# Seconds between background refreshes of a calendar, unless configured.
+DEFAULT_REFRESH_INTERVAL = 15 * 60
+
+_repositories = {}
+_repositories_lock = threading.Lock()
+
+
+def parse_color(value):
+    """Parse '#RRGGBB' or '#RRGGBBAA' into an rgba tuple, or None."""
+    if not value:
+        return None
+    value = value.strip().lstrip('#')
+    if len(value) not in (6, 8):
+        return None
+    try:
+        channels = [int(value[i:i + 2], 16) / 255 for i in range(0, len(value), 2)]
+    except ValueError:
+        return None
+    if len(channels) == 3:
+        channels.append(1)
+    return tuple(channels)
+
+
+class CalendarSource:
+    """
+    One calendar shown on the dashboard: the account it lives in, its
+    display name on the server (None for the account's first calendar),
+    the color its events are drawn in (None to use the server's) and how
+    many seconds to wait between background refreshes.
+    """
+
+    def __init__(self, calendar_url=DEFAULT_CALENDAR_URL, username=None, app_password=None,
+                 calendar_name=None, name=None, color=None, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        self.calendar_url = calendar_url
+        self.username = username
+        self.app_password = app_password
+        self.calendar_name = calendar_name
+        self.name = name or calendar_name or 'Calendar'
+        self.color = color
+        self.refresh_interval = refresh_interval
+
+    @property
+    def id(self):
+        return f"{self.calendar_url}#{self.username or ''}#{self.calendar_name or ''}"
+
+    @property
+    def account(self):
+        return (self.calendar_url, self.username, self.app_password)
+
+    def __repr__(self):
+        return f"CalendarSource({self.name!r})"
+
+
+def load_calendar_sources(calendar_url=DEFAULT_CALENDAR_URL):
+    """
+    Return the CalendarSources to merge.
+
+    If calendars.json exists next to .env (or at CALDAV_SOURCES_FILE) it
+    lists them, e.g.
+        [{"name": "Family", "calendar": "Family", "color": "#3478f6"},
+         {"name": "Work", "url": "https://dav.example.com/", "username": "me",
+          "app_password": "...", "calendar": "Work"}]
+    where url, username and app_password default to the .env account and
+    "refresh_interval" (seconds) to CALDAV_REFRESH_INTERVAL.
+    Otherwise CALENDAR_NAME may hold one or more comma-separated calendar
+    names of the .env account.
+    """
+    username = os.getenv("CALDAV_USERNAME")
+    app_password = os.getenv("CALDAV_APP_PASSWORD")
+    interval = float(os.getenv("CALDAV_REFRESH_INTERVAL", DEFAULT_REFRESH_INTERVAL))
+    path = os.getenv("CALDAV_SOURCES_FILE", SOURCES_PATH)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                entries = json.load(f)
+            return [
+                CalendarSource(
+                    entry.get('url', calendar_url),
+                    entry.get('username', username),
+                    entry.get('app_password', app_password),
+                    entry.get('calendar'),
+                    entry.get('name'),
+                    parse_color(entry.get('color')),
+                    float(entry.get('refresh_interval', interval)),
+                )
+                for entry in entries
+            ]
+        except Exception as e:
+            print(f"Failed to read calendar sources from {path}: {e}")
+
+    names = [name.strip() for name in (os.getenv("CALENDAR_NAME") or '').split(',') if name.strip()]
+    if not names:
+        return [CalendarSource(calendar_url, username, app_password, refresh_interval=interval)]
+    return [CalendarSource(calendar_url, username, app_password, name, refresh_interval=interval)
+            for name in names]
+
+
+def get_event_repository(calendar_url=DEFAULT_CALENDAR_URL):
+    """
+    Return the process-wide EventRepository for calendar_url.
+    Every widget asking for the same URL shares one repository, so adding
+    another calendar widget does not add any network round trips.
+    """
+    with _repositories_lock:
+        repository = _repositories.get(calendar_url)
+        if repository is None:
+            repository = EventRepository(
+                load_calendar_sources(calendar_url),
+                mode=os.getenv("CALDAV_FETCH_MODE", "sync"),
+                server_expand=os.getenv("CALDAV_SERVER_EXPAND", "").lower() in ("1", "true", "yes"),
+            )
+            _repositories[calendar_url] = repository
+        return repository
+
+
+class SourceFeed:
+    """
+    Fetch state of one CalendarSource inside an EventRepository: its
+    CalDAV calendar, sync state and records. Workers hold `lock` while
+    fetching into it or reading its records.
+    """
+
+    def __init__(self, source, color):
+        self.lock = threading.Lock()
+        self.source = source
+        self.color = color
+        self.calendar = None
+        self.calendar_sync = None
+        self.records = {}  # record href -> EventRecord, patched in place
+        self.fetched_range = None
+        self._resource_records = {}  # resource href -> [record href, ...]
+        self._cached_state = None
+
+    def load_cached(self, cache):
+        objects, records, ctag, sync_token = cache.load(self.source.id)
+        self._cached_state = (objects, ctag, sync_token)
+        for href, resource_records in records.items():
+            self._replace_resource(href, resource_records)
+        return bool(self.records)
+
+    @profiled('fetch.download_all')
+    def download_all(self):
+        events = self.calendar.events()
+        print(f"Fetched {len(events)} event(s) from '{self.source.name}'.")
+        load_event_bodies(events, self.calendar, (self.source.username, self.source.app_password))
+        self.records.clear()
+        self._resource_records.clear()
+        for event in events:
+            href = str(event.url)
+            self._replace_resource(href, self._build_records(event, href))
+        return True
+
+    @profiled('fetch.sync')
+    def sync(self, cache):
+        if self.calendar_sync is None:
+            self.calendar_sync = CalendarSync(self.calendar)
+            if self._cached_state is not None:
+                self.calendar_sync.restore(*self._cached_state)
+                self._cached_state = None
+        sync = self.calendar_sync
+        diff = sync.sync()
+        print(f"Synced '{self.source.name}': {diff}.")
+
+        # Parse only what changed; the body is not needed once parsed.
+        for href in diff.added + diff.changed:
+            obj = sync.objects[href]
+            self._replace_resource(href, self._build_records(obj, href, obj.etag))
+            obj.data = None
+        for href in diff.removed:
+            self._drop_resource(href)
+
+        if cache is not None:
+            resource_records = {
+                href: [self.records[key] for key in self._resource_records.get(href, [])]
+                for href in diff.added + diff.changed
+            }
+            try:
+                cache.store(self.source.id, sync.objects, resource_records, diff, sync.ctag, sync.sync_token)
+            except Exception as e:
+                print(f"Failed to update the event cache: {e}")
+        return not diff.unchanged
+
+    @profiled('fetch.range')
+    def fetch_range(self, start, end, expand):
+        """Raises SyncError if the server rejects time-range queries."""
+        objects = query_time_range(self.calendar, start, end, expand=expand)
+        print(f"Fetched {len(objects)} event(s) from '{self.source.name}' between {start} and {end}.")
+        changed = False
+        seen = set()
+        for obj in objects:
+            seen.add(obj.href)
+            keys = self._resource_records.get(obj.href)
+            # Unchanged ETag: keep the existing records, no re-parse or re-expansion.
+            if keys and obj.etag and all(self.records[key].etag == obj.etag for key in keys):
+                continue
+            self._replace_resource(obj.href, self._build_records(obj, obj.href, obj.etag))
+            changed = True
+        for href in list(self._resource_records):
+            if href not in seen:
+                self._drop_resource(href)
+                changed = True
+        self.fetched_range = (start, end)
+        return changed
+
+    def _build_records(self, event, href=None, etag=None):
+        try:
+            return build_event_records(event, href, etag, self.source.id)
+        except Exception as e:
+            print(f"Failed to parse event: {e}")
+            return []
+
+    def _replace_resource(self, href, records):
+        self._drop_resource(href)
+        self._resource_records[href] = [record.href for record in records]
+        for record in records:
+            self.records[record.href] = record
+
+    def _drop_resource(self, href):
+        for key in self._resource_records.pop(href, []):
+            self.records.pop(key, None)
+
+
+class EventRepository:
+    """
+    Shared store of the merged events of one or more CalDAV calendars.
+
+    Discovery, fetching and parsing run on worker threads: each account is
+    discovered once with a single PROPFIND, and all calendars are fetched
+    concurrently, so a refresh takes about as long as the slowest calendar.
+    Their records are merged into one list sorted by start, with events
+    that appear in several calendars (same UID and start) kept only once,
+    from the first configured calendar. Each record's `source` names its
+    CalendarSource; color_for() gives the color to draw it in.
+
+    Subscribers are plain callables taking that list of EventRecords and
+    an EventsDiff against the list they got before; they are always invoked
+    on the Kivy main thread through the Clock, so they may touch widgets
+    directly, and only when something actually changed. Each event version
+    is parsed exactly once, here, and its occurrences are expanded into the
+    shared `occurrences` index before subscribers are told about it.
+
+    After the first fetch a RefreshScheduler keeps every calendar fresh on
+    its own interval, with jitter and exponential backoff on errors.
+
+    Fetch modes:
+      - 'sync' (default): the first fetch downloads the calendar once and
+        later refreshes only transfer what changed, see CalendarSync. The
+        result is kept in an EventCache, so after a reboot subscribers get
+        the last known events from disk before any network round trip, and
+        still get them when offline.
+      - 'range': only events overlapping the requested time ranges are
+        fetched with calendar-query REPORTs, optionally expanded by the
+        server (server_expand). Widgets ask for what they show through
+        request_range(). Falls back to 'sync' if the server rejects it.
+      - 'full': re-download every event on every refresh.
+    """
+
+    def __init__(self, sources, mode='sync', server_expand=False, cache=None):
+        if mode not in FETCH_MODES:
+            print(f"Unknown fetch mode '{mode}'. Using 'sync'.")
+            mode = 'sync'
+        self.sources = list(sources)
+        self.mode = mode
+        self.server_expand = server_expand
+        self.cache = cache
+
+        self.calendars = []
+        self.events = []
+        self.occurrences = OccurrenceIndex()
+        self.loaded = False
+        self.fetched_range = None  # (start, end) naive UTC, range mode only
+
+        self._feeds = [
+            SourceFeed(source, source.color or DEFAULT_COLORS[i % len(DEFAULT_COLORS)])
+            for i, source in enumerate(self.sources)
+        ]
+        self._colors = {feed.source.id: feed.color for feed in self._feeds}
+        self._pool = ThreadPoolExecutor(max_workers=min(MAX_FETCH_WORKERS, max(len(self._feeds), 1)))
+        self._requested_range = None
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._discover_lock = threading.Lock()
+        self._worker = None
+        self.scheduler = None
+
+    def color_for(self, record):
+        """Return the rgba color of the calendar a record came from."""
+        return self._colors.get(record.source, DEFAULT_COLORS[0])
+
+    def subscribe(self, callback):
+        """
+        Register callback(events, diff). If events were already fetched the
+        callback receives them on the next frame; otherwise the first
+        subscription starts the background fetch.
+        """
+        with self._lock:
+            if callback not in self._subscribers:
+                self._subscribers.append(callback)
+            loaded = self.loaded
+            events = self.events
+        if loaded:
+            diff = EventsDiff([], events)
+            Clock.schedule_once(lambda dt: self._deliver(callback, events, diff))
+        else:
+            self.refresh()
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def request_range(self, start, end):
+        """
+        In range mode, make sure events overlapping [start, end] (naive UTC)
+        are fetched; the fetch runs in the background. No-op in other modes.
+        """
+        if self.mode != 'range':
+            return
+        with self._lock:
+            current = self._requested_range or self.fetched_range
+            if current and current[0] <= start and end <= current[1]:
+                return
+            if current:
+                start, end = min(start, current[0]), max(end, current[1])
+            self._requested_range = (start, end)
+        self.refresh()
+
+    def refresh(self):
+        """Start a background fetch unless one is already running."""
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._fetch, daemon=True)
+            self._worker.start()
+
+    def _fetch(self):
+        if self.mode == 'sync' and not self.loaded:
+            self._load_cached()
+        while True:
+            try:
+                self._discover()
+                if self.mode == 'range':
+                    with self._lock:
+                        span = self._requested_range or self._default_range()
+                        if self.fetched_range is None:
+                            # The first fetch covers the default window too, so
+                            # an early month request does not narrow it.
+                            default = self._default_range()
+                            span = (min(span[0], default[0]), max(span[1], default[1]))
+                        self._requested_range = span
+                else:
+                    span = None
+                # Not any(map(...)): that would stop collecting results at the
+                # first changed feed, while the others may still be fetching.
+                results = list(self._pool.map(lambda feed: self._fetch_feed_safely(feed, span), self._feeds))
+                changed = any(results)
+            except Exception as e:
+                print(f"Failed to fetch calendar events: {e}")
+                break
+
+            with self._lock:
+                if span is not None:
+                    self.fetched_range = span
+                # A widget may have asked for a wider range meanwhile.
+                again = self.mode == 'range' and self._requested_range not in (None, self.fetched_range)
+            if changed or not self.loaded:
+                self._publish_merged()
+            if not again:
+                break
+        self._start_scheduler()
+
+    def _start_scheduler(self):
+        with self._lock:
+            if self.scheduler is not None:
+                return
+            self.scheduler = RefreshScheduler()
+        for feed in self._feeds:
+            self.scheduler.add(feed.source.id, lambda feed=feed: self._refresh_feed(feed),
+                               feed.source.refresh_interval)
+        self.scheduler.start()
+
+    def _refresh_feed(self, feed):
+        """Scheduler job for one calendar; raises on failure so the scheduler backs off."""
+        self._discover()
+        if feed.calendar is None:
+            raise RuntimeError(f"calendar '{feed.source.name}' is not available")
+        with self._lock:
+            span = self.fetched_range or self._default_range()
+        if self._fetch_feed(feed, span):
+            self._publish_merged()
+
+    def _fetch_feed_safely(self, feed, span):
+        # One failing calendar must not hold back the others.
+        try:
+            return self._fetch_feed(feed, span)
+        except Exception as e:
+            print(f"Failed to fetch '{feed.source.name}': {e}")
+            return False
+
+    def _fetch_feed(self, feed, span):
+        if feed.calendar is None:
+            return False
+        with feed.lock:
+            with self._lock:
+                mode = self.mode
+            if mode == 'range':
+                try:
+                    return feed.fetch_range(span[0], span[1], self.server_expand)
+                except SyncError as e:
+                    # Feeds fail in parallel; switch (and report) only once.
+                    with self._lock:
+                        switched = self.mode == 'range'
+                        self.mode = 'sync'
+                    if switched:
+                        print(f"Time-range queries are not supported, falling back to incremental sync: {e}")
+                    mode = 'sync'
+            if mode == 'sync':
+                return feed.sync(self._cache())
+            return feed.download_all()
+
+    def _discover(self):
+        with self._discover_lock:
+            self._discover_pending()
+
+    def _discover_pending(self):
+        # One discovery per account, all accounts at once; retried for
+        # calendars whose account could not be reached last time.
+        pending = {}
+        for feed in self._feeds:
+            if feed.calendar is None:
+                pending.setdefault(feed.source.account, []).append(feed)
+        if not pending:
+            return
+        accounts = list(pending)
+        results = self._pool.map(lambda account: self._list_calendars(*account), accounts)
+        for account, calendars in zip(accounts, results):
+            with self._lock:
+                self.calendars.extend(entry[0] for entry in calendars)
+            for feed in pending[account]:
+                selected = select_calendar(calendars, feed.source.calendar_name)
+                if selected is None:
+                    continue
+                feed.calendar = selected[0]
+                if feed.source.color is None and parse_color(selected[2]):
+                    feed.color = parse_color(selected[2])
+                    self._colors[feed.source.id] = feed.color
+
+    def _list_calendars(self, calendar_url, username, app_password):
+        try:
+            return list_calendars(calendar_url, username, app_password)
+        except Exception as e:
+            print(f"Failed to connect to {calendar_url}: {e}")
+            return []
+
+    def _cache(self):
+        if self.cache is None:
+            self.cache = EventCache()
+        return self.cache
+
+    def _load_cached(self):
+        # Publish whatever the last run left on disk, before touching the network.
+        found = False
+        for feed in self._feeds:
+            try:
+                found = feed.load_cached(self._cache()) or found
+            except Exception as e:
+                print(f"Failed to load cached events: {e}")
+        if not found:
+            return
+        print("Loaded cached events.")
+        self._publish_merged()
+
+    def _merge(self):
+        """
+        Merged records of all feeds, sorted by start. An event shared into
+        several calendars appears once: records with the same UID and
+        RECURRENCE-ID (the part of the record href after '#') are kept
+        from the first feed only. Records of one feed are never dropped.
+        """
+        owners = {}  # (uid, recurrence-id) -> feed
+        events = []
+        for feed in self._feeds:
+            with feed.lock:
+                records = list(feed.records.values())
+            for record in records:
+                if record.uid:
+                    identity = (record.uid, record.href.partition('#')[2])
+                    if owners.setdefault(identity, feed) is not feed:
+                        continue
+                events.append(record)
+        events.sort(key=lambda record: record.start)
+        return events
+
+    def _default_range(self):
+        now = to_naive_utc(datetime.now(timezone.utc))
+        return now - self.occurrences.lookbehind, now + self.occurrences.lookahead
+
+    def _publish_merged(self):
+        """Merge all feeds and notify subscribers if anything changed."""
+        with self._publish_lock:
+            events = self._merge()
+            with self._lock:
+                first_load = not self.loaded
+                diff = EventsDiff(self.events, events)
+                self.events = events
+                self.loaded = True
+            if diff.unchanged and not first_load:
+                return
+            # Expand changed series off the UI thread so widget queries are lookups.
+            self.occurrences.update(events)
+            self.occurrences.roll()
+            with self._lock:
+                subscribers = list(self._subscribers)
+            for callback in subscribers:
+                Clock.schedule_once(lambda dt, callback=callback: self._deliver(callback, events, diff))
+
+    @profiled('EventRepository.deliver')
+    def _deliver(self, callback, events, diff):
+        # The subscriber may have gone away between scheduling and delivery.
+        with self._lock:
+            if callback not in self._subscribers:
+                return
+        callback(events, diff)
+
+
+class EventsDiff:
+    """Records added, changed and removed between two published event lists."""
+
+    def __init__(self, old, new):
+        old_records = {record.key: record for record in old}
+        new_records = {record.key: record for record in new}
+        self.added = [r for key, r in new_records.items() if key not in old_records]
+        # Range fetches rebuild records that did not change; compare those by value.
+        self.changed = [r for key, r in new_records.items()
+                        if key in old_records and old_records[key] is not r
+                        and old_records[key].to_dict() != r.to_dict()]
+        self.removed = [r for key, r in old_records.items() if key not in new_records]
+
+    @property
+    def unchanged(self):
+        return not (self.added or self.changed or self.removed)
+
+    def __repr__(self):
+        return (f"EventsDiff(added={len(self.added)}, changed={len(self.changed)}, "
+                f"removed={len(self.removed)})")
@@ -1,12 +1,27 @@
 from kivy.uix.widget import Widget
 from kivy.properties import ObjectProperty, NumericProperty
 from kivy.core.window import Window
-from kivy.graphics import Color, Line
+from kivy.graphics import Color, Mesh
 
 class GridOverlay(Widget):
+    """
+    Grid lines shown while a card is dragged or resized.
+
+    All lines are one retained Mesh in 'lines' mode whose vertices are
+    rewritten in place. Geometry changes while the overlay is hidden only
+    mark it stale; the mesh is rebuilt when it becomes visible again.
+    """
     grid_size = ObjectProperty((12, 12))
     line_color = (1, 0, 0, 0.3)
 
+    def __init__(self, **kwargs):
+        self._stale = True
+        super().__init__(**kwargs)
+        with self.canvas:
+            Color(*self.line_color)
+            self._mesh = Mesh(mode='lines')
+        self.update_grid()
+
     def on_size(self, *args):
         self.update_grid()
 
@@ -16,23 +31,31 @@ class GridOverlay(Widget):
     def on_grid_size(self, *args):
         self.update_grid()
 
+    def on_opacity(self, *args):
+        if self.opacity > 0 and self._stale:
+            self.update_grid()
+
     def update_grid(self):
-        self.canvas.clear()
-        with self.canvas:
-            Color(*self.line_color)
+        self._stale = True
+        if self.opacity <= 0 or not hasattr(self, '_mesh'):
+            return
+
+        cols, rows = self.grid_size
+        total_width = Window.width
+        total_height = Window.height
+        cell_w = max(total_width / cols, 1)
+        cell_h = max(total_height / rows, 1)
 
-            cols, rows = self.grid_size
-            total_width = Window.width
-            total_height = Window.height
-            cell_w = max(total_width / cols, 1)
-            cell_h = max(total_height / rows, 1)
-
-            # Draw vertical lines
-            for c in range(cols + 1):
-                x = c * cell_w
-                Line(points=[x, 0, x, Window.height])
-            
-            # Draw horizontal lines
-            for r in range(rows + 1):
-                y = r * cell_h
-                Line(points=[0, y, Window.width, y])
\ No newline at end of file
+        # Each vertex is x, y, u, v; each line is a pair of indices.
+        vertices = []
+        # Vertical lines
+        for c in range(cols + 1):
+            x = c * cell_w
+            vertices += [x, 0, 0, 0, x, total_height, 0, 0]
+        # Horizontal lines
+        for r in range(rows + 1):
+            y = r * cell_h
+            vertices += [0, y, 0, 0, total_width, y, 0, 0]
+        self._mesh.vertices = vertices
+        self._mesh.indices = list(range(len(vertices) // 4))
+        self._stale = False
@@ -0,0 +1,148 @@
+import importlib
+import os
+from collections import OrderedDict
+from kivy.uix.floatlayout import FloatLayout
+from profiles.profile_manager import load_profile, save_profile
+from widgets.dashboard_layout import DashboardLayout
+
+# type -> (module, class, extra constructor options kept in the layout)
+WIDGET_TYPES = {
+    'calendar': ('widgets.calendar_widget', 'CalendarWidget', ('calendar_url',)),
+    'upcoming': ('widgets.upcoming_events_widget', 'UpcomingEventsWidget', ('calendar_url', 'max_events')),
+}
+
+# The dashboard of a profile that has not saved one yet.
+DEFAULT_DASHBOARD = [
+    {'type': 'calendar', 'grid_width': 6, 'grid_height': 6},
+    {'type': 'upcoming', 'grid_width': 3, 'grid_height': 12},
+]
+
+
+def widget_class(kind):
+    if kind not in WIDGET_TYPES:
+        return None
+    module_name, class_name, _options = WIDGET_TYPES[kind]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+class ProfileDashboard:
+    """
+    One profile's cards, their DashboardLayout and their data
+    subscriptions, under a container that is swapped in and out of the
+    screen. Off screen the cards stay subscribed but suspended, so
+    showing the dashboard again costs one render pass per card.
+
+    The layout is stored under the 'dashboard' key of the profile, as a
+    list of {'type', 'col', 'row', 'grid_width', 'grid_height', ...}.
+    """
+
+    def __init__(self, profile_name, grid_size=(12, 12), overlay=None):
+        self.profile_name = profile_name
+        self.overlay = overlay
+        self.container = FloatLayout()
+        self.layout = DashboardLayout(grid_size=grid_size)
+        self.cards = []
+        self._specs = {}  # card -> (type, options)
+
+    def build(self, spec):
+        for entry in spec:
+            kind = entry.get('type')
+            card_class = widget_class(kind)
+            if card_class is None:
+                print(f"Unknown widget type '{kind}' in the dashboard of '{self.profile_name}'.")
+                continue
+            options = {key: entry[key] for key in WIDGET_TYPES[kind][2] if key in entry}
+            card = card_class(grid_size=self.layout.grid_size,
+                              grid_width=entry.get('grid_width', 1),
+                              grid_height=entry.get('grid_height', 1),
+                              **options)
+            card.overlay = self.overlay
+            self.container.add_widget(card)
+            self.layout.register(card, entry.get('col'), entry.get('row'))
+            self.cards.append(card)
+            self._specs[card] = (kind, options)
+        # Placements from now on are the user's; persist them.
+        self.layout.on_change = self.save
+
+    def export(self):
+        """The current layout, in the form build() takes."""
+        spec = []
+        for card in self.cards:
+            kind, options = self._specs[card]
+            col, row, w, h = self.layout.placement(card)
+            spec.append(dict(options, type=kind, col=col, row=row, grid_width=w, grid_height=h))
+        return spec
+
+    def save(self, *args):
+        # Dragging fires many placements; the profile store debounces them.
+        data = dict(load_profile(self.profile_name) or {})
+        data['dashboard'] = self.export()
+        save_profile(self.profile_name, data, debounce=True)
+
+    def activate(self):
+        for card in self.cards:
+            card.resume()
+
+    def deactivate(self):
+        for card in self.cards:
+            card.suspend()
+
+    def destroy(self):
+        self.layout.on_change = None
+        for card in self.cards:
+            self.layout.unregister(card)
+            card.release()
+        self.layout.release()
+        self.container.clear_widgets()
+        self.cards = []
+        self._specs = {}
+
+
+class ProfileDashboards:
+    """
+    Warm ProfileDashboards of the most recently seen profiles, shown one
+    at a time inside `parent`. Switching to a cached profile detaches one
+    container and attaches another; nothing is rebuilt or refetched.
+    Dashboards beyond max_profiles are destroyed, least recently shown
+    first.
+    """
+
+    def __init__(self, parent, overlay=None, grid_size=(12, 12), max_profiles=None):
+        self.parent = parent
+        self.overlay = overlay
+        self.grid_size = grid_size
+        self.max_profiles = max(int(max_profiles or os.getenv('DASHBOARD_CACHE_SIZE', 3)), 1)
+        self.active = None
+        self._dashboards = OrderedDict()
+
+    def get(self, profile_name):
+        """The profile's dashboard, built from its saved layout on first use."""
+        dashboard = self._dashboards.get(profile_name)
+        if dashboard is None:
+            settings = load_profile(profile_name) or {}
+            dashboard = ProfileDashboard(profile_name, self.grid_size, self.overlay)
+            dashboard.build(settings.get('dashboard') or DEFAULT_DASHBOARD)
+            dashboard.deactivate()
+            self._dashboards[profile_name] = dashboard
+        self._dashboards.move_to_end(profile_name)
+        return dashboard
+
+    def show(self, profile_name):
+        dashboard = self.get(profile_name)
+        if dashboard is not self.active:
+            if self.active is not None:
+                self.active.deactivate()
+                self.parent.remove_widget(self.active.container)
+            self.parent.add_widget(dashboard.container)
+            dashboard.activate()
+            self.active = dashboard
+        self._evict()
+        return dashboard
+
+    def _evict(self):
+        while len(self._dashboards) > self.max_profiles:
+            profile_name = next(iter(self._dashboards))
+            if self._dashboards[profile_name] is self.active:
+                self._dashboards.move_to_end(profile_name)
+                continue
+            self._dashboards.pop(profile_name).destroy()
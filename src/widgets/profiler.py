@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+
+# Rolling file the stats are dumped to, see dump().
+PROFILE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache', 'profile.jsonl')
+
+
+class Profiler:
+    """
+    Collects durations of named sections: frames, Clock callbacks, widget
+    renders, parsing and network fetches.
+
+    Disabled (the default) it costs one attribute check per call. Enabled,
+    each section keeps count, total, max and last duration, and dump()
+    appends a snapshot as one JSON line to a file that is rotated once it
+    grows past max_bytes.
+    """
+
+    def __init__(self, path=PROFILE_PATH, max_bytes=1024 * 1024, backups=3):
+        self.enabled = False
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._stats = {}  # name -> [count, total, max, last] in seconds
+        self._lock = threading.Lock()
+
+    def record(self, name, duration):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                self._stats[name] = [1, duration, duration, duration]
+                return
+            stats[0] += 1
+            stats[1] += duration
+            if duration > stats[2]:
+                stats[2] = duration
+            stats[3] = duration
+
+    @contextmanager
+    def section(self, name):
+        """Time the body of a with-block as name."""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def snapshot(self):
+        """{name: {'count', 'mean_ms', 'max_ms', 'last_ms'}} of everything recorded."""
+        with self._lock:
+            items = [(name, list(stats)) for name, stats in self._stats.items()]
+        return {
+            name: {
+                'count': count,
+                'mean_ms': total / count * 1000,
+                'max_ms': longest * 1000,
+                'last_ms': last * 1000,
+            }
+            for name, (count, total, longest, last) in items
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def dump(self):
+        """Append a timestamped snapshot to the rolling profile file."""
+        line = json.dumps({'time': time.time(), 'stats': self.snapshot()})
+        try:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                self._rotate()
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+        except OSError as e:
+            print(f"Failed to write profile to {self.path}: {e}")
+
+    def _rotate(self):
+        # profile.jsonl -> profile.jsonl.1 -> ... -> profile.jsonl.<backups>
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+profiler = Profiler()
+
+
+def profiled(name=None, per_class=False):
+    """
+    Decorator timing every call of a function while the profiler is
+    enabled. per_class=True prefixes the name with the class of the first
+    argument, attributing a shared method to each widget type.
+    """
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            section = f"{type(args[0]).__name__}.{func.__name__}" if per_class and args else label
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record(section, time.perf_counter() - started)
+        return wrapper
+    return decorator
@@ -0,0 +1,59 @@
+from kivy.clock import Clock
+from kivy.graphics import Color, Rectangle
+from kivy.uix.label import Label
+from widgets.profiler import profiler
+
+
+class ProfilerHUD(Label):
+    """
+    On-screen readout of the profiler, drawn over the dashboard like the
+    GridOverlay. Creating it turns the profiler on and starts timing
+    frames; the text is refreshed once a second, and every dump_interval
+    seconds (0 disables) a snapshot is appended to the profile file.
+    """
+
+    def __init__(self, rows=12, dump_interval=60, **kwargs):
+        kwargs.setdefault('font_size', 11)
+        kwargs.setdefault('size_hint', (None, None))
+        kwargs.setdefault('halign', 'left')
+        kwargs.setdefault('valign', 'top')
+        super().__init__(**kwargs)
+        self.rows = rows
+        with self.canvas.before:
+            Color(0, 0, 0, 0.6)
+            self.background = Rectangle(pos=self.pos, size=self.size)
+        self.bind(pos=self._update_background, size=self._update_background)
+        self.bind(texture_size=self.setter('size'))
+
+        profiler.enabled = True
+        self._frame_event = Clock.schedule_interval(self._on_frame, 0)
+        self._text_event = Clock.schedule_interval(self._update_text, 1)
+        self._dump_event = Clock.schedule_interval(lambda dt: profiler.dump(), dump_interval) if dump_interval else None
+
+    def _update_background(self, *args):
+        self.background.pos = self.pos
+        self.background.size = self.size
+
+    def _on_frame(self, dt):
+        # dt is the time since the previous frame.
+        profiler.record('frame', dt)
+
+    def _update_text(self, dt):
+        stats = profiler.snapshot()
+        frame = stats.pop('frame', None)
+        lines = []
+        if frame:
+            fps = 1000 / frame['mean_ms'] if frame['mean_ms'] else 0
+            lines.append(f"frame {frame['mean_ms']:.1f} ms avg, {frame['max_ms']:.1f} ms max ({fps:.0f} fps)")
+        # Slowest sections first.
+        ranked = sorted(stats.items(), key=lambda item: item[1]['max_ms'], reverse=True)
+        for name, s in ranked[:self.rows]:
+            lines.append(f"{name}: {s['count']}x {s['mean_ms']:.1f} avg {s['max_ms']:.1f} max ms")
+        self.text = '\n'.join(lines) or 'profiling...'
+
+    def stop(self):
+        """Stop sampling and turn the profiler back off."""
+        for event in (self._frame_event, self._text_event, self._dump_event):
+            if event is not None:
+                event.cancel()
+        profiler.enabled = False
@@ -0,0 +1,111 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+
+class RefreshScheduler:
+    """
+    Runs periodic jobs on one worker thread.
+
+    Each job has its own interval. Every delay is spread by +/- jitter (a
+    fraction of the delay) so that several mirrors started together do not
+    hit the server in lockstep. A job that raises is retried after
+    retry_delay seconds (or its interval, if shorter), doubling with every
+    further failure up to max_backoff seconds, and goes back to its normal
+    interval after its next success.
+    """
+
+    def __init__(self, jitter=0.1, retry_delay=30, max_backoff=3600):
+        self.jitter = jitter
+        self.retry_delay = retry_delay
+        self.max_backoff = max_backoff
+        self._jobs = {}  # name -> [func, interval, failures]
+        self._queue = []  # (due, seq, name)
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def add(self, name, func, interval, initial_delay=None):
+        """
+        Run func() every interval seconds, the first time after
+        initial_delay (default: one interval). Replaces a job of the same name.
+        """
+        with self._condition:
+            self._jobs[name] = [func, interval, 0]
+            delay = interval if initial_delay is None else initial_delay
+            self._push(name, self._jittered(delay))
+
+    def remove(self, name):
+        with self._condition:
+            self._jobs.pop(name, None)
+
+    def run_soon(self, name):
+        """Run a job on the next turn of the worker instead of waiting for it."""
+        with self._condition:
+            if name in self._jobs:
+                self._push(name, 0)
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def _jittered(self, delay):
+        return max(0.0, delay * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def _push(self, name, delay):
+        heapq.heappush(self._queue, (time.monotonic() + delay, next(self._seq), name))
+        self._condition.notify()
+
+    def _next_job(self):
+        # Wait for the earliest due job; None once stopped.
+        with self._condition:
+            while self._running:
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+                due, _seq, name = self._queue[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                heapq.heappop(self._queue)
+                job = self._jobs.get(name)
+                if job is None:
+                    continue
+                # Drop duplicates queued by run_soon; the job is rescheduled below.
+                self._queue = [entry for entry in self._queue if entry[2] != name]
+                heapq.heapify(self._queue)
+                return name, job
+            return None
+
+    def _run(self):
+        while True:
+            next_job = self._next_job()
+            if next_job is None:
+                return
+            name, job = next_job
+            func, interval, _failures = job
+            try:
+                func()
+                job[2] = 0
+                delay = interval
+            except Exception as e:
+                job[2] += 1
+                first_retry = min(self.retry_delay, interval)
+                delay = min(first_retry * (2 ** (job[2] - 1)), self.max_backoff)
+                print(f"Refresh of {name} failed ({job[2]} in a row), retrying in {delay:.0f}s: {e}")
+            with self._condition:
+                if self._jobs.get(name) is job:
+                    self._push(name, self._jittered(delay))
@@ -0,0 +1,39 @@
+import threading
+import time
+
+
+class StartupTimer:
+    """
+    Records when each startup stage is reached, relative to `started`
+    (a time.perf_counter() value taken as early as possible), and prints
+    a report once the last expected stage is marked.
+    """
+
+    def __init__(self, started=None, expected=()):
+        self.started = time.perf_counter() if started is None else started
+        self.expected = list(expected)
+        self.stages = []  # (name, seconds since start)
+        self._lock = threading.Lock()
+        self._reported = False
+
+    def mark(self, name):
+        with self._lock:
+            if any(stage == name for stage, _elapsed in self.stages):
+                return
+            self.stages.append((name, time.perf_counter() - self.started))
+            done = not self._reported and all(
+                any(stage == wanted for stage, _elapsed in self.stages) for wanted in self.expected
+            )
+            if done:
+                self._reported = True
+        if done:
+            self.report()
+
+    def report(self):
+        with self._lock:
+            stages = list(self.stages)
+        print("Startup:")
+        previous = 0
+        for name, elapsed in stages:
+            print(f"  {name:<28} {elapsed * 1000:8.0f} ms  (+{(elapsed - previous) * 1000:.0f} ms)")
+            previous = elapsed
@@ -0,0 +1,127 @@
+import os
+from collections import OrderedDict
+from kivy.clock import Clock
+from kivy.core.text import Label as CoreLabel
+from kivy.core.text.markup import MarkupLabel
+from kivy.graphics import Color, Rectangle
+from kivy.properties import (StringProperty, NumericProperty, BooleanProperty,
+                             ListProperty, OptionProperty)
+from kivy.uix.widget import Widget
+
+
+class TextureCache:
+    """
+    Rasterized text shared by every label that shows the same thing.
+
+    Textures are keyed by everything that changes their pixels (text, font
+    size, weight, color, markup, wrap width, alignment, shortening) and
+    kept in least-recently-used order; the oldest are dropped once their
+    RGBA footprint exceeds max_bytes. Widgets holding a dropped texture
+    keep drawing it, it just is not handed out again.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._textures = OrderedDict()  # key -> (texture, bytes)
+
+    def get(self, text, font_size=15, bold=False, color=(1, 1, 1, 1), markup=False,
+            text_size=(None, None), halign='left', shorten=False):
+        key = (text, font_size, bold, tuple(color), markup, tuple(text_size), halign, shorten)
+        entry = self._textures.get(key)
+        if entry is not None:
+            self._textures.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        label_class = MarkupLabel if markup else CoreLabel
+        label = label_class(text=text, font_size=font_size, bold=bold, color=tuple(color),
+                            text_size=tuple(text_size), halign=halign,
+                            shorten=shorten, shorten_from='right')
+        label.refresh()
+        texture = label.texture
+        if texture is None:
+            return None
+        size = texture.width * texture.height * 4
+        self._textures[key] = (texture, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and len(self._textures) > 1:
+            _key, (_texture, evicted) = self._textures.popitem(last=False)
+            self.bytes -= evicted
+        return texture
+
+    def clear(self):
+        self._textures.clear()
+        self.bytes = 0
+
+    def __repr__(self):
+        return (f"TextureCache({len(self._textures)} textures, {self.bytes / 1024 / 1024:.1f} MB, "
+                f"{self.hits} hits, {self.misses} misses)")
+
+
+texture_cache = TextureCache(int(float(os.getenv("TEXT_TEXTURE_CACHE_MB", 32)) * 1024 * 1024))
+
+
+class CachedLabel(Widget):
+    """
+    A label that draws a texture from the shared texture_cache instead of
+    rasterizing its own. It lays the texture out by halign/valign within
+    its box; with wrap or shorten the text is fitted to its width minus
+    padding_x. Setting the same text again is free.
+    """
+    text = StringProperty('')
+    font_size = NumericProperty(15)
+    bold = BooleanProperty(False)
+    color = ListProperty([1, 1, 1, 1])
+    markup = BooleanProperty(False)
+    halign = OptionProperty('center', options=['left', 'center', 'right'])
+    valign = OptionProperty('middle', options=['top', 'middle', 'bottom'])
+    shorten = BooleanProperty(False)
+    wrap = BooleanProperty(False)
+    padding_x = NumericProperty(0)
+
+    def __init__(self, **kwargs):
+        self._update_trigger = Clock.create_trigger(self._update_texture, -1)
+        super().__init__(**kwargs)
+        with self.canvas:
+            Color(1, 1, 1, 1)
+            self._rect = Rectangle(size=(0, 0))
+        self.bind(text=self._update_trigger, font_size=self._update_trigger, bold=self._update_trigger,
+                  color=self._update_trigger, markup=self._update_trigger, halign=self._update_trigger,
+                  shorten=self._update_trigger, wrap=self._update_trigger, size=self._update_trigger,
+                  padding_x=self._update_trigger)
+        self.bind(pos=self._place, valign=self._place)
+        self._update_texture()
+
+    def _update_texture(self, *args):
+        if not self.text:
+            self._rect.texture = None
+            self._rect.size = (0, 0)
+            return
+        text_size = (None, None)
+        if self.wrap or self.shorten:
+            text_size = (max(int(self.width - 2 * self.padding_x), 1), None)
+        texture = texture_cache.get(self.text, self.font_size, self.bold, self.color, self.markup,
+                                    text_size, self.halign, self.shorten)
+        self._rect.texture = texture
+        self._rect.size = texture.size if texture is not None else (0, 0)
+        self._place()
+
+    def _place(self, *args):
+        width, height = self._rect.size
+        if self.halign == 'left':
+            x = self.x + self.padding_x
+        elif self.halign == 'right':
+            x = self.right - self.padding_x - width
+        else:
+            x = self.center_x - width / 2
+        if self.valign == 'top':
+            y = self.top - height
+        elif self.valign == 'bottom':
+            y = self.y
+        else:
+            y = self.center_y - height / 2
+        self._rect.pos = (int(x), int(y))
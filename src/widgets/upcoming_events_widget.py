@@ -1,177 +1,132 @@
 import os
-import requests
-import icalendar
 from datetime import datetime, date, time, timezone, timedelta
-from dateutil.rrule import rrulestr
-from dateutil import tz
-from kivy.uix.boxlayout import BoxLayout
+from kivy.graphics import Color, Line
+from kivy.metrics import dp
 from kivy.uix.label import Label
-from kivy.uix.scrollview import ScrollView
-from dotenv import load_dotenv
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.utils import get_hex_from_color, escape_markup
 from widgets.base_widget import WidgetCard
-from widgets.calendar_common import to_naive_utc, to_local_display, get_parsed_event, connect_to_calendar
-from widgets.no_touch_label import NonTouchLabel
+from widgets.calendar_common import to_naive_utc, to_local_display
+from widgets.event_repository import get_event_repository, DEFAULT_CALENDAR_URL
+from widgets.texture_cache import CachedLabel
+from widgets.profiler import profiled
 
-# Load .env from project root
-project_root = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
-load_dotenv(dotenv_path=project_root)
+# How far past the lookahead a range-mode fetch reaches.
+HORIZON_SLACK = timedelta(days=7)
+
+class UpcomingEventRow(CachedLabel):
+    """
+    One row of the upcoming list. RecycleView creates just enough of them
+    to fill the visible area and reuses them while scrolling, so the
+    border and bindings are set up once per row, not once per event.
+    Row text comes from the shared texture cache, so scrolling back to a
+    row or re-rendering an unchanged list does not rasterize it again.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(markup=True, halign='left', valign='middle',
+                         wrap=True, padding_x=10, **kwargs)
+        # Draw a border around the row.
+        with self.canvas.before:
+            Color(0, 0, 0, .25)
+            self.border_line = Line(rectangle=(self.x, self.y, self.width, self.height), width=1)
+        self.bind(pos=self._update_border, size=self._update_border)
+
+    def _update_border(self, *args):
+        self.border_line.rectangle = (self.x, self.y, self.width, self.height)
 
-try:
-    import caldav
-    from caldav.elements import dav
-except ImportError:
-    caldav = None
 
 class UpcomingEventsWidget(WidgetCard):
     def __init__(self, **kwargs):
-        # Retrieve credentials and (optionally) the target calendar name from environment.
-        self.username = os.getenv("CALDAV_USERNAME")
-        self.app_password = os.getenv("CALDAV_APP_PASSWORD")
-        self.calendar_url = kwargs.pop('calendar_url', 'https://caldav.icloud.com/')
-        self.target_calendar_name = os.getenv("CALENDAR_NAME")
+        self.calendar_url = kwargs.pop('calendar_url', DEFAULT_CALENDAR_URL)
+        # How many upcoming occurrences to list; there is no time horizon.
+        # Only the visible rows are ever instantiated, so this can be large.
+        self.max_events = int(kwargs.pop('max_events', os.getenv('UPCOMING_MAX_EVENTS', 100)))
         
         super().__init__(**kwargs)
         
         self.title = "Upcoming Events"
-        self.calendars = []
         self.events = []
         
-        # Create a container for event details inside a ScrollView.
-        self.event_list = BoxLayout(orientation='vertical', spacing=5, size_hint_y=None)
-        self.event_list.bind(minimum_height=self.event_list.setter('height'))
-        self.scroll = ScrollView(size_hint=(1, 1))
-        self.scroll.add_widget(self.event_list)
-        self.add_widget(self.scroll)
+        # A virtualized list over plain dicts (see event_rows).
+        self.event_list = RecycleView(size_hint=(1, 1), viewclass=UpcomingEventRow)
+        layout = RecycleBoxLayout(orientation='vertical', spacing=5, size_hint_y=None,
+                                  default_size=(None, dp(70)), default_size_hint=(1, None))
+        layout.bind(minimum_height=layout.setter('height'))
+        self.event_list.add_widget(layout)
+        self.add_widget(self.event_list)
+        self.empty_label = Label(text="No upcoming events.", size_hint_y=None, height=30)
         
-        # Connect to calendar and render events.
-        self.calendars, default_cal = connect_to_calendar(self.calendar_url, self.username, self.app_password, self.target_calendar_name)
-        if default_cal:
-            self.events = default_cal.events()
-            print(f"Fetched {len(self.events)} event(s) from the selected calendar.")
+        # Render the empty list on the first frame and fill it in when the
+        # shared repository delivers events from its worker thread.
+        self.repository = get_event_repository(self.calendar_url)
+        self.invalidate(data=True)
+        self.repository.subscribe(self.on_events)
+
+    def on_events(self, events, diff=None):
+        # Called on the main thread whenever the repository has new events.
+        self.events = events
+        self.invalidate(data=True)
+
+    def release(self):
+        super().release()
+        self.repository.unsubscribe(self.on_events)
+
+    def refresh_data(self):
         self.render_events()
 
+    @profiled(per_class=True)
     def render_events(self):
-        # Clear previous content.
-        self.event_list.clear_widgets()
-        
-        # Collect individual event occurrences as dictionaries.
-        upcoming_events = []
+        # Look up the next occurrences in the shared occurrence index; it is
+        # already sorted by start, and anything past its window comes from a
+        # lazy merge that stops after max_events, so nothing is over-expanded.
         now = to_naive_utc(datetime.now(timezone.utc))
-        # Define a window for recurrence expansion in days
-        window_end = now + timedelta(days=180)
-        
-        for event in self.events:
-            try:
-                parsed = get_parsed_event(event)
-                dtstart_prop = parsed.get('dtstart')
-                if not dtstart_prop:
-                    raise AttributeError("dtstart property not found")
-                dtstart = dtstart_prop.dt
-                # Convert date-only values to datetime.
-                if isinstance(dtstart, date) and not isinstance(dtstart, datetime):
-                    dtstart = datetime.combine(dtstart, time.min)
-                # Convert dtstart to a naive UTC datetime.
-                dtstart_naive = to_naive_utc(dtstart)
-                
-                # Determine event duration.
-                if parsed.get('dtend'):
-                    dtend = parsed.get('dtend').dt
-                    if isinstance(dtend, date) and not isinstance(dtend, datetime):
-                        dtend = datetime.combine(dtend, time.min)
-                    duration = dtend - dtstart
-                else:
-                    duration = timedelta(hours=1)
-                
-                # Check if the event is recurring.
-                rrule_prop = parsed.get('rrule')
-                if rrule_prop:
-                    # Expand the recurrence rule using the naive dtstart.
-                    rule_str = rrule_prop.to_ical().decode('utf-8')
-                    rule = rrulestr(rule_str, dtstart=dtstart_naive)
-                    occurrences = rule.between(now, window_end, inc=True)
-                    # Also include the original dtstart if it falls within the window.
-                    if dtstart_naive >= now and dtstart_naive <= window_end and dtstart_naive not in occurrences:
-                        occurrences.insert(0, dtstart_naive)
-                    for occ in occurrences:
-                        occ_naive = occ  # Already naive UTC.
-                        if occ_naive >= now:
-                            occ_event = {
-                                'dtstart': occ_naive,
-                                'dtend': occ_naive + duration,
-                                'summary': parsed.get('summary', 'Unnamed'),
-                                'location': parsed.get('location', 'No Location')
-                            }
-                            upcoming_events.append(occ_event)
-                else:
-                    # Non-recurring event.
-                    if dtstart_naive >= now:
-                        event_dict = {
-                            'dtstart': dtstart_naive,
-                            'dtend': dtstart_naive + duration,
-                            'summary': parsed.get('summary', 'Unnamed'),
-                            'location': parsed.get('location', 'No Location')
-                        }
-                        upcoming_events.append(event_dict)
-            except Exception as ex:
-                print(f"Failed to process an event: {ex}")
-                continue
-        
-        # Sort upcoming events by start time.
-        try:
-            upcoming_events.sort(key=lambda ev: ev['dtstart'])
-        except Exception as ex:
-            print(f"Failed to sort events: {ex}")
-        
-        # Limit to the next 10 events.
-        upcoming_events = upcoming_events[:10]
+        # In range mode only the fetched span is known; make sure it
+        # reaches the upcoming horizon. The extra week keeps every render
+        # from asking for a few more seconds (and a refetch). A no-op in
+        # the other modes.
+        horizon = now + self.repository.occurrences.lookahead
+        fetched = self.repository.fetched_range
+        if fetched is None or fetched[1] < horizon:
+            self.repository.request_range(now, horizon + HORIZON_SLACK)
+        upcoming_events = self.repository.occurrences.next_after(now, self.max_events)
         print(f"Upcoming events: {len(upcoming_events)}")
-        
-        if not upcoming_events:
-            no_event_label = Label(text="No upcoming events.", size_hint_y=None, height=30)
-            self.event_list.add_widget(no_event_label)
-            return
-        
-        # Render each occurrence, converting times to the user's local time zone.
+
+        # Replacing the data only rebinds the visible rows; the view is kept.
+        self.event_list.data = self.event_rows(upcoming_events)
+        if not upcoming_events and self.empty_label.parent is None:
+            self.add_widget(self.empty_label)
+        elif upcoming_events and self.empty_label.parent is not None:
+            self.remove_widget(self.empty_label)
+
+    def event_rows(self, upcoming_events):
+        """RecycleView data for the given occurrences, in local time."""
+        rows = []
         for ev in upcoming_events:
             try:
-                local_start = to_local_display(ev['dtstart'])
-                local_end = to_local_display(ev['dtend']) if ev['dtend'] else None
+                local_start = to_local_display(ev.start)
+                local_end = to_local_display(ev.end) if ev.end else None
                 
                 date_str = local_start.strftime('%B %d, %Y')
                 start_time = local_start.strftime('%I:%M %p')
                 end_time = local_end.strftime('%I:%M %p') if local_end else "N/A"
                 
-                title = ev['summary']
+                title = ev.record.summary
                 if hasattr(title, 'to_ical'):
                     title = title.to_ical().decode('utf-8')
                 else:
                     title = str(title)
                 
+                # Tint the title with the color of the calendar it came from.
+                color = get_hex_from_color(self.repository.color_for(ev.record))
                 details = (
                     f"[b]{date_str}[/b]\n"
                     f"{start_time} - {end_time}\n"
-                    f"{title}"
+                    f"[color={color}]{escape_markup(title)}[/color]"
                 )
             except Exception as ex:
                 details = "Event details unavailable"
                 print(f"Failed to render event details: {ex}")
-            label = NonTouchLabel(
-                text=details,
-                size_hint_y=None,
-                markup=True,
-                halign='left',
-                text_size=(self.width - 20, None)
-            )
-            def update_height(instance, value):
-                instance.height = instance.texture_size[1] + 20  # add padding if desired
-            label.bind(texture_size=update_height)
-            
-            # Draw a border around the label.
-            from kivy.graphics import Color, Line
-            with label.canvas.before:
-                Color(0, 0, 0, .25)
-                label.border_line = Line(rectangle=(label.x, label.y, label.width, label.height), width=1)
-            def update_label_border(instance, value):
-                instance.border_line.rectangle = (instance.x, instance.y, instance.width, instance.height)
-            label.bind(pos=update_label_border, size=update_label_border)
-            self.event_list.add_widget(label)
+            rows.append({'text': details})
+        return rows
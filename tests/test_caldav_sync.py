@@ -0,0 +1,138 @@
+import pytest
+
+caldav = pytest.importorskip('caldav')
+
+from fake_caldav import FakeCalDAVServer, FakeCalendar
+from widgets.caldav_sync import CalendarSync
+
+EVENT = """BEGIN:VCALENDAR\r
+VERSION:2.0\r
+PRODID:-//mirrormind//tests//EN\r
+BEGIN:VEVENT\r
+UID:event-{i}@tests\r
+DTSTAMP:20240101T000000Z\r
+DTSTART:2024010{day}T090000Z\r
+DTEND:2024010{day}T100000Z\r
+SUMMARY:Event {i}\r
+END:VEVENT\r
+END:VCALENDAR\r
+"""
+
+
+@pytest.fixture
+def fake_calendar():
+    return FakeCalendar('Test', {f'event-{i}.ics': EVENT.format(i=i, day=i + 1) for i in range(5)})
+
+
+@pytest.fixture
+def server(fake_calendar):
+    with FakeCalDAVServer([fake_calendar]) as server:
+        yield server
+
+
+@pytest.fixture
+def multigets(monkeypatch):
+    """Hrefs of every multiget, one list per call."""
+    calls = []
+    original = CalendarSync.multiget
+
+    def recording_multiget(self, hrefs):
+        calls.append(sorted(hrefs))
+        return original(self, hrefs)
+
+    monkeypatch.setattr(CalendarSync, 'multiget', recording_multiget)
+    return calls
+
+
+@pytest.fixture
+def sync(server, fake_calendar):
+    client = caldav.DAVClient(url=server.url, username='test', password='test')
+    sync = CalendarSync(client.calendar(url=server.url + fake_calendar.path.lstrip('/')))
+    sync.sync()
+    server.requests.clear()
+    return sync
+
+
+def href(fake_calendar, filename):
+    return fake_calendar.path + filename
+
+
+def test_initial_sync_downloads_everything(sync, fake_calendar):
+    assert sorted(sync.objects) == sorted(href(fake_calendar, name) for name in fake_calendar.objects)
+    assert sync.ctag == f'ctag-{fake_calendar.version}'
+
+
+def test_unchanged_ctag_costs_one_propfind(sync, server, multigets):
+    diff = sync.sync()
+
+    assert diff.unchanged
+    assert server.requests == {'PROPFIND': 1}
+    assert multigets == []
+
+
+def test_modified_etag_fetches_only_that_href(sync, server, fake_calendar, multigets):
+    name = sorted(fake_calendar.objects)[2]
+    fake_calendar.put(name, fake_calendar.objects[name].replace('SUMMARY:', 'SUMMARY:Edited ', 1))
+
+    diff = sync.sync()
+
+    assert diff.changed == [href(fake_calendar, name)]
+    assert diff.added == [] and diff.removed == []
+    assert multigets == [[href(fake_calendar, name)]]
+    assert 'Edited' in sync.objects[href(fake_calendar, name)].data
+
+
+def test_add_and_delete(sync, fake_calendar, multigets):
+    deleted, template = sorted(fake_calendar.objects)[:2]
+    fake_calendar.delete(deleted)
+    fake_calendar.put('added.ics', fake_calendar.objects[template].replace(
+        template[:-len('.ics')], 'added', 1))
+
+    diff = sync.sync()
+
+    assert diff.added == [href(fake_calendar, 'added.ics')]
+    assert diff.removed == [href(fake_calendar, deleted)]
+    assert multigets == [[href(fake_calendar, 'added.ics')]]
+    assert sorted(sync.objects) == sorted(href(fake_calendar, name) for name in fake_calendar.objects)
+
+
+def test_etag_listing_without_sync_token_support(sync, fake_calendar, multigets):
+    # Servers with only a ctag: a full ETag listing, still fetching only what changed.
+    sync.supports_sync_token = False
+    sync.sync_token = None
+    edited, deleted = sorted(fake_calendar.objects)[:2]
+    fake_calendar.put(edited, fake_calendar.objects[edited].replace('SUMMARY:', 'SUMMARY:Edited ', 1))
+    fake_calendar.delete(deleted)
+
+    diff = sync.sync()
+
+    assert diff.changed == [href(fake_calendar, edited)]
+    assert diff.removed == [href(fake_calendar, deleted)]
+    assert multigets == [[href(fake_calendar, edited)]]
+
+
+def test_stale_sync_token_falls_back_to_etag_listing(sync, fake_calendar):
+    sync.sync_token = 'token-999'
+    name = sorted(fake_calendar.objects)[0]
+    fake_calendar.delete(name)
+
+    diff = sync.sync()
+
+    assert diff.removed == [href(fake_calendar, name)]
+    assert sync.supports_sync_token
+
+
+def test_deletions_found_after_syncing_without_a_token(sync, fake_calendar):
+    # After an ETag fallback or a restore without a token the next
+    # sync-collection starts over and gets a full listing, no 404s.
+    sync.sync_token = None
+    first, second = sorted(fake_calendar.objects)[:2]
+    fake_calendar.delete(first)
+    assert sync.sync().removed == [href(fake_calendar, first)]
+
+    sync.restore({}, None, None)
+    fake_calendar.delete(second)
+    diff = sync.sync()
+
+    assert diff.removed == [href(fake_calendar, second)]
+    assert sorted(sync.objects) == sorted(href(fake_calendar, name) for name in fake_calendar.objects)
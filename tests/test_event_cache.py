@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from widgets.caldav_sync import RemoteObject, SyncDiff
+from widgets.calendar_common import EventRecord
+from widgets.event_cache import EventCache
+
+SOURCE = 'test'
+
+
+def etag(href, version=1):
+    return f'"{href}-{version}"'
+
+
+def store(cache, diff, ended_days_ago, version=1):
+    """Store every href of diff as a one-hour event that ended that long ago."""
+    end = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=ended_days_ago)
+    hrefs = diff.added + diff.changed
+    objects = {href: RemoteObject(href, etag(href, version), None) for href in hrefs}
+    records = {href: [EventRecord(href, etag(href, version), href, 'Event', '',
+                                  end - timedelta(hours=1), timedelta(hours=1))]
+               for href in hrefs}
+    cache.store(SOURCE, objects, records, diff, 'ctag', 'token')
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EventCache(str(tmp_path / 'events.sqlite3'), max_age_days=30)
+    yield cache
+    cache.close()
+
+
+def test_evicted_events_stay_known_without_records(cache):
+    store(cache, SyncDiff(added=['/old.ics']), ended_days_ago=60)
+    store(cache, SyncDiff(added=['/new.ics']), ended_days_ago=1)
+
+    objects, records, _ctag, _token = cache.load(SOURCE)
+
+    # The ETag of the evicted event is kept, so a listing does not fetch it again.
+    assert sorted(objects) == ['/new.ics', '/old.ics']
+    assert objects['/old.ics'].etag == etag('/old.ics')
+    assert list(records) == ['/new.ics']
+
+
+def test_edited_evicted_event_is_cached_again(cache):
+    store(cache, SyncDiff(added=['/old.ics']), ended_days_ago=60)
+    store(cache, SyncDiff(changed=['/old.ics']), ended_days_ago=1, version=2)
+
+    objects, records, _ctag, _token = cache.load(SOURCE)
+
+    assert objects['/old.ics'].etag == etag('/old.ics', 2)
+    assert list(records) == ['/old.ics']
+
+
+def test_deleted_evicted_event_is_forgotten(cache):
+    store(cache, SyncDiff(added=['/old.ics']), ended_days_ago=60)
+    store(cache, SyncDiff(removed=['/old.ics']), ended_days_ago=1)
+
+    objects, records, _ctag, _token = cache.load(SOURCE)
+
+    assert objects == {} and records == {}
+
+
+def test_events_over_max_events_are_evicted_oldest_first(tmp_path):
+    cache = EventCache(str(tmp_path / 'events.sqlite3'), max_events=2)
+    for days, href in enumerate(['/c.ics', '/b.ics', '/a.ics']):
+        store(cache, SyncDiff(added=[href]), ended_days_ago=days)
+
+    objects, records, _ctag, _token = cache.load(SOURCE)
+    cache.close()
+
+    assert sorted(objects) == ['/a.ics', '/b.ics', '/c.ics']
+    assert sorted(records) == ['/b.ics', '/c.ics']
@@ -0,0 +1,56 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('dateutil')
+pytest.importorskip('icalendar')
+
+from widgets.calendar_common import EventRecord, upcoming_occurrences
+
+RULES = [
+    'FREQ=HOURLY',
+    'FREQ=HOURLY;INTERVAL=5;BYMINUTE=0,30',
+    'FREQ=DAILY;BYHOUR=8,20',
+    'FREQ=DAILY;INTERVAL=3',
+    'FREQ=DAILY;BYMONTHDAY=1,15',
+    'FREQ=DAILY;UNTIL=20270101T000000',
+    'FREQ=WEEKLY;BYDAY=MO,WE,FR',
+    'FREQ=WEEKLY;INTERVAL=2;BYDAY=TU,SU;WKST=SU',
+    'FREQ=WEEKLY;BYDAY=MO,FR;BYSETPOS=-1',
+    'FREQ=MONTHLY;BYDAY=2TU',
+    'FREQ=DAILY;COUNT=400',
+]
+
+
+def record(rule, start):
+    return EventRecord('/cal/series.ics', None, 'series', 'Series', 'Somewhere', start,
+                       timedelta(minutes=30), rrule=rule, exdates=[start + timedelta(days=7)])
+
+
+def series_cases(count=300, seed=3):
+    rng = random.Random(seed)
+    for _ in range(count):
+        start = datetime(2024, 1, 1) + timedelta(minutes=rng.randint(0, 800000))
+        query = start + timedelta(minutes=rng.randint(-1000, 900000))
+        yield rng.choice(RULES), start, query
+
+
+def test_anchored_expansion_matches_full_expansion():
+    for rule, start, query in series_cases():
+        full = record(rule, start).ruleset()
+        anchored = record(rule, start)
+        end = query + timedelta(days=20)
+        assert anchored.occurrences_between(query, end) == full.between(query, end, inc=True), (rule, start, query)
+        expected = [occ for _, occ in zip(range(15), full.xafter(query, inc=True))]
+        assert [occ.start for occ in upcoming_occurrences([anchored], query, 15)] == expected, (rule, start, query)
+
+
+def test_anchor_stays_a_whole_number_of_periods_before_start():
+    series = record('FREQ=DAILY;INTERVAL=3', datetime(2020, 1, 1, 9, 0))
+    anchor = series.anchor(datetime(2024, 6, 1))
+    assert anchor < datetime(2024, 6, 1) - timedelta(days=3)
+    assert (anchor - series.start) % timedelta(days=3) == timedelta(0)
+    # COUNT is counted from the real DTSTART, so such rules are not moved.
+    counted = record('FREQ=DAILY;COUNT=5000', datetime(2020, 1, 1, 9, 0))
+    assert counted.anchor(datetime(2024, 6, 1)) == counted.start